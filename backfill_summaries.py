@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Writes weight summary sidecars for existing snapshots that don't have them
+"""
+import argparse
+from modules.SnapshotIndex import SnapshotIndex
+from modules.WeightSummary import backfill_run
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+parser.add_argument("--dataset", type=str, help="Only backfill this dataset")
+parser.add_argument("--net_name", type=str, help="Only backfill this net")
+parser.add_argument("--overwrite", dest="overwrite", action="store_true", 
+                    help="Rewrite existing sidecars")
+parser.set_defaults(overwrite=False)
+
+
+def main(data_dir, dataset, net_name, overwrite):
+    
+    index = SnapshotIndex(data_dir)
+    runs = index.query_runs(dataset=dataset, net_name=net_name)
+
+    n_written = 0
+    for run_dir, snapshots in runs.items():
+
+        # deltas are relative to epoch 0
+        if snapshots[0]["epoch"] != 0:
+            print(f"Skipping {run_dir}, it has no epoch 0 snapshot")
+            continue
+        
+        n_written += backfill_run([s["path"] for s in snapshots], overwrite)
+
+    # register the new sidecars, so cached results built on them refresh
+    index.reconcile()
+
+    print(f"backfill_summaries.py wrote {n_written} summaries")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks training throughput on synthetic data, with and without the
+optional per cell type telemetry and gradient checkpointing, and reports the
+overhead and memory of each
+"""
+import argparse
+import tempfile
+import time
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from modules.NetManager import NetManager
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default=None, type=str, help="Set value for data_dir, a temp dir if not given")
+parser.add_argument("--net_name", default="vgg11_cifar", type=str, help="Set value for net_name")
+parser.add_argument("--n_classes", default=10, type=int, help="Set value for n_classes")
+parser.add_argument("--image_size", default=32, type=int, help="Side length of the synthetic images")
+parser.add_argument("--batch_size", default=64, type=int, help="Set value for batch_size")
+parser.add_argument("--n_batches", default=20, type=int, help="Timed batches per configuration")
+parser.add_argument("--n_repeat", default=1, type=int, help="Set value for n_repeat")
+parser.add_argument("--act_fns", default=["relu", "tanh"], nargs="+", type=str, help="Set value for act_fns")
+parser.add_argument("--n_trials", default=3, type=int, help="Trials per configuration, the best is reported")
+parser.add_argument("--act_stats_rate", default=0.1, type=float, help="Sample rate for the act_stats configuration")
+parser.add_argument("--checkpoint_segments", default=[2, 4], nargs="+", type=int, help="Segment counts to benchmark checkpointing with")
+
+
+def time_training(manager, n_batches, n_repeat, act_fns, configure=None):
+    """
+    Times n_batches of training after a short warmup, returning samples
+    per second and peak memory of a training step
+    """
+    manager.init_net("benchmark", 0)
+    manager.replace_act_layers(n_repeat, act_fns, ["None"] * len(act_fns))
+    if configure is not None:
+        configure(manager)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.SGD(manager.net.parameters(), lr=0.001, momentum=0.9)
+    warmup_frac = 2. / len(manager.train_loader)
+    manager.train_net(criterion, optimizer, None, warmup_frac)
+
+    if manager.device.type == "cuda":
+        torch.cuda.synchronize()
+    since = time.time()
+    
+    manager.train_net(criterion, optimizer, None, 
+        n_batches / len(manager.train_loader))
+    
+    # include the once per epoch sync
+    all_stats = [s for s in [manager.act_stats, manager.grad_stats] 
+        if s is not None]
+    for stats in all_stats:
+        stats.flush(0, NullLog())
+
+    if manager.device.type == "cuda":
+        torch.cuda.synchronize()
+    throughput = n_batches * manager.train_loader.batch_size / (time.time() - since)
+
+    # with the stats hooks still attached, they're part of what's measured
+    inputs, labels = next(iter(manager.train_loader))
+    memory = manager.measure_step_memory(inputs, labels, criterion)
+    manager.set_checkpointing(None)
+
+    for stats in all_stats:
+        stats.close()
+    manager.act_stats = None
+    manager.grad_stats = None
+
+    return throughput, memory
+
+class NullLog():
+    """
+    Stands in for a metrics log, so flushing is timed without disk writes
+    """
+    def append(self, records):
+        pass
+
+def main(data_dir, net_name, n_classes, image_size, batch_size, n_batches,
+    n_repeat, act_fns, n_trials, act_stats_rate, checkpoint_segments):
+    
+    data_dir = data_dir if data_dir is not None else tempfile.mkdtemp()
+    manager = NetManager("synthetic", net_name, n_classes, data_dir, "sgd")
+
+    # synthetic data, already on the device
+    n_samples = batch_size * n_batches
+    inputs = torch.randn(n_samples, 3, image_size, image_size)
+    labels = torch.randint(n_classes, (n_samples,))
+    manager.train_set = torch.utils.data.TensorDataset(inputs, labels)
+    manager.train_loader = torch.utils.data.DataLoader(manager.train_set, 
+        batch_size=batch_size, shuffle=False)
+
+    configs = {
+        "baseline": None,
+        "act_stats": lambda m: m.track_act_stats(act_stats_rate),
+        "grad_stats": lambda m: m.track_grad_stats(),
+        "act_stats + grad_stats": lambda m: (m.track_act_stats(act_stats_rate), 
+            m.track_grad_stats())
+    }
+    for n_segments in checkpoint_segments:
+        configs[f"checkpoint {n_segments}"] = (lambda m, n=n_segments: 
+            m.set_checkpointing(n))
+
+    # interleave trials so drift in machine load hits every configuration
+    results = { name: 0. for name in configs }
+    memory = dict()
+    for trial in range(n_trials):
+        for name, configure in configs.items():
+            throughput, memory[name] = time_training(manager, n_batches, 
+                n_repeat, act_fns, configure)
+            results[name] = max(results[name], throughput)
+
+    print(f"\n{'configuration':<24} {'samples/s':>10} {'overhead':>9} {'memory MB':>10}")
+    for name, throughput in results.items():
+        overhead = results["baseline"] / throughput - 1
+        print(f"{name:<24} {throughput:>10.1f} {overhead:>8.1%} {memory[name] / 2**20:>10.1f}")
+
+    print("benchmark_training.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Computes minibatch CKA between the saved responses of every case, sample 
+and layer given
+"""
+import argparse
+import os
+from modules.CKA import find_response_files, load_cka_df
+from modules.util import ensure_sub_dir
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+parser.add_argument("--dataset", default="imagenette2", type=str, help="Set value for dataset")
+parser.add_argument("--net_name", type=str, help="Set value for net_name")
+parser.add_argument("--scheme", type=str, help="Set scheme")
+parser.add_argument("--cases", nargs="+", type=str, help="Set cases")
+parser.add_argument("--layers", nargs="+", type=str, help="Set layers")
+parser.add_argument("--epoch", type=int, help="Only compare responses from this epoch")
+parser.add_argument("--batch_size", default=256, type=int, help="Stimuli per minibatch")
+parser.add_argument("--n_workers", default=1, type=int, help="Processes to split stimuli across")
+
+
+def main(data_dir, dataset, net_name, scheme, cases, layers, epoch, batch_size,
+    n_workers):
+    
+    files_df = find_response_files(data_dir, dataset, net_name, scheme, cases,
+        layers, epoch)
+    print(f"Comparing {len(files_df)} response files")
+    cka_df = load_cka_df(files_df, batch_size, n_workers)
+
+    sub_dir = ensure_sub_dir(data_dir, "dataframes/")
+    filename = os.path.join(sub_dir, f"{net_name}_{scheme}_cka.csv")
+    cka_df.to_csv(filename, header=True, index=False)
+    print(f"Saved {filename}")
+
+    print("cka_responses.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
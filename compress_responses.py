@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Converts saved responses (.npy, or legacy stacked .pt) under responses/ to
+the quantized, chunk-compressed .rsp format
+"""
+import argparse
+import glob
+import os
+import numpy as np
+import torch
+from modules.ResponseStore import CompressedResponseWriter, rsp_ext
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+parser.add_argument("--mode", default="int8", type=str, help="int8, fp16 or fp32")
+parser.add_argument("--chunk_size", default=256, type=int, help="Stimuli per compressed chunk")
+parser.add_argument("--delete", dest="delete", action="store_true", 
+                    help="Delete the originals once converted")
+parser.set_defaults(delete=False)
+
+
+def load_responses(filepath):
+    """
+    Loads responses as (n_stimuli, ...), memory-mapped if possible
+    """
+    if filepath.endswith(".npy"):
+        return np.load(filepath, mmap_mode="r")
+
+    # legacy responses were a stack of per-batch tensors
+    responses = torch.load(filepath, map_location="cpu")
+    return responses.reshape(-1, *responses.shape[2:]).numpy()
+
+def main(data_dir, mode, chunk_size, delete):
+    
+    resp_dir = os.path.join(data_dir, "responses/")
+    filepaths = glob.glob(os.path.join(resp_dir, "**/*.npy"), recursive=True) \
+        + glob.glob(os.path.join(resp_dir, "**/*.pt"), recursive=True)
+
+    for filepath in sorted(filepaths):
+        
+        out_path = os.path.splitext(filepath)[0] + rsp_ext
+        if os.path.exists(out_path):
+            continue
+
+        print(f"Compressing {filepath}")
+        responses = load_responses(filepath)
+        writer = CompressedResponseWriter(out_path, mode, chunk_size)
+        for start in range(0, len(responses), chunk_size):
+            writer.write(torch.from_numpy(np.array(responses[start:start + chunk_size])))
+        writer.close()
+
+        before = os.path.getsize(filepath)
+        after = os.path.getsize(out_path)
+        print(f"{before / 2**20:.1f} MB -> {after / 2**20:.1f} MB")
+        
+        if delete:
+            os.remove(filepath)
+
+    print("compress_responses.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-evaluates every snapshot of the given runs against the validation set,
+e.g. for accuracy per class over training or metrics old runs didn't save
+"""
+import argparse
+import os
+from modules.NetManager import NetManager
+from modules.SnapshotEvaluator import SnapshotEvaluator
+from modules.ResponseStore import spatial_mean
+from modules.util import ensure_sub_dir
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+parser.add_argument("--dataset", default="imagenette2", type=str, help="Set value for dataset")
+parser.add_argument("--net_name", type=str, help="Set value for net_name")
+parser.add_argument("--n_classes", default=10, type=int, help="Set value for n_classes")
+parser.add_argument("--schemes", nargs="+", type=str, help="Set schemes")
+parser.add_argument("--cases", nargs="+", type=str, help="Set cases")
+parser.add_argument("--batch_size", default=64, type=int, help="Set value for batch_size")
+parser.add_argument("--chunk_size", default=8, type=int, help="Nets evaluated per pass over the data")
+parser.add_argument("--layers", nargs="+", type=str, help="Also save these layers' spatially averaged responses")
+parser.add_argument("--quantize", default=None, type=str, help="Evaluate int8 nets on CPU: dynamic (Linear layers) or static (also convs)")
+
+
+def main(data_dir, dataset, net_name, n_classes, schemes, cases, batch_size,
+    chunk_size, layers, quantize=None):
+    
+    manager = NetManager(dataset, net_name, n_classes, data_dir, None)
+    manager.load_dataset(batch_size)
+
+    runs = manager.snapshot_index.query_runs(dataset=dataset, net_name=net_name,
+        train_schemes=schemes, cases=cases)
+    snapshot_paths = [row["path"] for rows in runs.values() for row in rows]
+
+    evaluator = SnapshotEvaluator(manager, snapshot_paths, chunk_size, 
+        quantize=quantize)
+    metrics_df = evaluator.evaluate(n_classes, layers, spatial_mean)
+
+    sub_dir = ensure_sub_dir(data_dir, "dataframes/")
+    suffix = f"_{quantize}_int8" if quantize is not None else ""
+    filename = os.path.join(sub_dir, f"{net_name}_snapshot_metrics{suffix}.csv")
+    metrics_df.to_csv(filename, header=True, index=False)
+    print(f"Saved {filename}")
+
+    print("evaluate_snapshots.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
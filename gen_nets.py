@@ -6,6 +6,8 @@ Created on Wed Jul  1 12:11:26 2020
 @author: briardoty
 """
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 from modules.NetManager import NetManager
 
 # general params
@@ -24,6 +26,9 @@ parser.add_argument("--n_repeat", type=int)
 parser.add_argument("--act_fns", type=str, nargs="+", help="Set value for act_fns")
 parser.add_argument("--act_fn_params", type=str, nargs="+", help="Set value for act_fn_params")
 parser.add_argument("--dataset", type=str, required=True, help="Set dataset")
+parser.add_argument("--n_workers", default=1, type=int, help="Number of processes generating samples")
+parser.add_argument("--offline", dest="offline", action="store_true", help="Only use locally cached pretrained weights")
+parser.set_defaults(offline=False)
 
 # pretrained is a PITA since it's a bool
 pretrained_parser = parser.add_mutually_exclusive_group(required=False)
@@ -31,24 +36,54 @@ pretrained_parser.add_argument('--pretrained', dest='pretrained', action='store_
 pretrained_parser.add_argument('--untrained', dest='pretrained', action='store_false')
 parser.set_defaults(pretrained=False)
 
+def gen_sample(case, sample, n_repeat, act_fns, act_fn_params, data_dir, 
+    net_name, n_classes, pretrained, scheme, dataset, offline, seed=None, 
+    manager=None):
+    """
+    Generates and saves a single sample of the given case
+    """
+    if manager is None:
+        manager = NetManager(dataset, net_name, n_classes, data_dir, scheme, 
+            pretrained, seed, offline)
+
+    # init net
+    manager.init_net(case, sample)
+    
+    # modify layers
+    if (act_fns is not None and len(act_fns) > 0):
+        manager.replace_act_layers(n_repeat, act_fns, act_fn_params)
+    
+    # save
+    manager.save_net_snapshot()
+
 def main(case, layer_names, n_repeat, act_fns, act_fn_params, data_dir, 
-         net_name, n_classes, n_samples, pretrained, scheme, dataset):
+         net_name, n_classes, n_samples, pretrained, scheme, dataset, 
+         n_workers, offline):
     
     # init net manager
-    manager = NetManager(dataset, net_name, n_classes, data_dir, scheme, pretrained)
+    manager = NetManager(dataset, net_name, n_classes, data_dir, scheme, 
+        pretrained, offline=offline)
+    sample_args = (n_repeat, act_fns, act_fn_params, data_dir, net_name, 
+        n_classes, pretrained, scheme, dataset, offline)
     
     # build and save nets
-    for i in range(n_samples):
-
-        # init net
-        manager.init_net(case, i)
-        
-        # modify layers
-        if (act_fns is not None and len(act_fns) > 0):
-            manager.replace_act_layers(n_repeat, act_fns, act_fn_params)
-        
-        # save
-        manager.save_net_snapshot()
+    if n_workers <= 1:
+        for i in range(n_samples):
+            gen_sample(case, i, *sample_args, manager=manager)
+
+    else:
+        # populate the weight cache once so workers don't all fetch it
+        if pretrained:
+            manager.build_net(pretrained)
+
+        # distinct seeds, since workers can start within the same second
+        base_seed = int(time.time())
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(gen_sample, case, i, *sample_args, 
+                seed=base_seed + i) for i in range(n_samples)]
+            
+            for future in futures:
+                future.result()
 
     print(f"gen_nets.py completed case {case}")
     return   
@@ -8,7 +8,6 @@ Created on Thu Jul  2 15:21:08 2020
 import argparse
 import json
 import sys
-import re
 import os
 from itertools import chain
 
@@ -16,6 +15,10 @@ from itertools import chain
 sys.path.append("/home/briar.doty/pbstools")
 from pbstools import PythonJob
 
+# repo modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules.SnapshotIndex import SnapshotIndex
+
 # paths
 python_executable = "/allen/programs/braintv/workgroups/nc-ophys/briar.doty/anaconda3/envs/dlct2/bin/python"
 conda_env = "/allen/programs/braintv/workgroups/nc-ophys/briar.doty/anaconda3/envs/dlct2"
@@ -32,10 +35,12 @@ parser.add_argument("--lr", type=float)
 parser.add_argument("--lr_step_size", type=int)
 parser.add_argument("--lr_gamma", type=float)
 parser.add_argument("--batch_size", type=int)
+parser.add_argument("--memory_budget", type=float, help="Pick the largest batch size fitting in this many GB")
+parser.add_argument("--lr_rule", type=str, help="Learning rate scaling rule with --memory_budget")
 parser.set_defaults(resume=False)
 
 def main(net_name, cases, scheme, resume, lr, lr_step_size, lr_gamma, 
-    batch_size, dataset):
+    batch_size, dataset, memory_budget, lr_rule):
     
     # check
     if scheme == "sgd" and lr is None:
@@ -61,44 +66,33 @@ def main(net_name, cases, scheme, resume, lr, lr_step_size, lr_gamma,
     run_params["lr_step_size"] = lr_step_size if lr_step_size is not None else run_params["lr_step_size"]
     run_params["lr_gamma"] = lr_gamma if lr_gamma is not None else run_params["lr_gamma"]
     run_params["batch_size"] = batch_size if batch_size is not None else run_params["batch_size"]
+    if memory_budget is not None:
+        run_params["memory_budget"] = memory_budget
+    if lr_rule is not None:
+        run_params["lr_rule"] = lr_rule
 
     job_settings = job_params["job_settings"]
     
     # set to avoid submitting jobs for the same net twice
     net_filepaths = set()
 
-    # walk dir looking for nets to train
-    net_dir = os.path.join(run_params["data_dir"], f"nets/{dataset}/{net_name}")
-    for root, dirs, files in os.walk(net_dir):
-        
-        # only interested in locations files (nets) are saved
-        if len(files) <= 0:
-            continue
-        
-        slugs = root.split("/")
-
-        # only interested in the given dataset
-        if not dataset in slugs:
-            continue
-
-        # only interested in the given training scheme
-        if not scheme in slugs:
-            continue
-
-        # only interested in the given case
-        if not any(c in slugs for c in cases):
-            continue
+    # look up runs of the given dataset, net, scheme and cases
+    index = SnapshotIndex(run_params["data_dir"])
+    runs = index.query_runs(dataset=dataset, net_name=net_name, 
+        train_schemes=[scheme], cases=cases)
+    for run_dir, snapshots in runs.items():
         
         # start from first or last epoch
         if resume:
-            net_filename = get_last_epoch(files)
-            print(f"Submitting job to resume training of {net_filename}.")
+            net_filepath = snapshots[-1]["path"]
+            print(f"Submitting job to resume training of {net_filepath}.")
+        elif snapshots[0]["epoch"] == 0:
+            net_filepath = snapshots[0]["path"]
+            print(f"Job will begin from initial snapshot {net_filepath}.")
         else:
-            net_filename = get_first_epoch(files)
-            print(f"Job will begin from initial snapshot {net_filename}.")
+            continue
 
         # and add it to the training job set
-        net_filepath = os.path.join(root, net_filename)
         net_filepaths.add(net_filepath)
 
     # loop over set, submitting jobs
@@ -117,44 +111,11 @@ def main(net_name, cases, scheme, resume, lr, lr_step_size, lr_gamma,
             python_executable,
             conda_env = conda_env,
             python_args = params_string,
-            jobname = job_title + f" {net_filename}",
+            jobname = job_title + f" {os.path.basename(net_filepath)}",
             jobdir = job_dir,
             **job_settings
         ).run(dryrun=False)
 
-def get_epoch_from_filename(filename):
-    
-    epoch = re.search(r"\d+\.pt$", filename)
-    epoch = int(epoch.group().split(".")[0]) if epoch else None
-    
-    return epoch
-    
-def get_first_epoch(net_filenames):
-    
-    for filename in net_filenames:
-        
-        epoch = get_epoch_from_filename(filename)
-        if epoch == 0:
-            return filename
-
-def get_last_epoch(net_filenames):
-    
-    max_epoch = -1
-    last_net_filename = None
-    
-    for filename in net_filenames:
-        
-        epoch = get_epoch_from_filename(filename)
-
-        if epoch is None:
-            continue
-
-        if epoch > max_epoch:
-            max_epoch = epoch
-            last_net_filename = filename
-
-    return last_net_filename
-
 if __name__=="__main__":
     args = parser.parse_args()
     print(args)
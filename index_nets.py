@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rebuilds the snapshot index from what's on disk under nets/
+"""
+import argparse
+from modules.SnapshotIndex import SnapshotIndex
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+
+
+def main(data_dir):
+    
+    index = SnapshotIndex(data_dir)
+    index.reconcile()
+
+    print("index_nets.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Online statistics of each cell type's activations during training. Forward
+hooks on every MixedActivationLayer accumulate per cell type sums, sparsity,
+saturation and a histogram on the device, which are synced once per epoch
+and appended to the run's act_stats metrics log.
+"""
+import torch
+import numpy as np
+import os
+
+try:
+    from .MixedActivationLayer import MixedActivationLayer
+except:
+    from MixedActivationLayer import MixedActivationLayer
+
+try:
+    from .HookRegistry import HookRegistry
+except:
+    from HookRegistry import HookRegistry
+
+try:
+    from .MetricsLog import MetricsLog
+except:
+    from MetricsLog import MetricsLog
+
+try:
+    from .SegmentStats import segment_sum, group_channels, other_dims
+except:
+    from SegmentStats import segment_sum, group_channels, other_dims
+
+act_stats_log_name = "act_stats.mlog"
+
+def get_act_stats_fields(n_bins):
+
+    return [
+        ("epoch", "<i4"),
+        ("layer", "<i4"),
+        ("cell_type", "<i4"),
+        ("count", "<f8"),
+        ("mean", "<f8"),
+        ("var", "<f8"),
+        ("sparsity", "<f8"),
+        ("saturation", "<f8")
+    ] + [(f"hist_{i}", "<f8") for i in range(n_bins)]
+
+class ActivationStats():
+    """
+    Accumulates per cell type activation statistics for every 
+    MixedActivationLayer in net while it's in training mode.
+
+    Args:
+        net
+        sample_rate (float): Fraction of training batches to record, to 
+            bound overhead.
+        hist_range (tuple): Histogram range, values outside it go in the
+            end bins.
+        n_bins (int)
+        sat_threshold (float): Inputs with magnitude above this count as
+            saturated.
+        sparse_eps (float): Outputs with magnitude at most this count as 
+            inactive.
+    """
+
+    def __init__(self, net, sample_rate=0.1, hist_range=(-3., 3.), n_bins=32,
+        sat_threshold=3., sparse_eps=1e-6):
+
+        self.net = net
+        self.sample_rate = sample_rate
+        self.hist_range = hist_range
+        self.n_bins = n_bins
+        self.sat_threshold = sat_threshold
+        self.sparse_eps = sparse_eps
+        self.registry = HookRegistry(net)
+        self.layer_names = self.registry.find(MixedActivationLayer)
+        self.layers = []
+
+        for name in self.layer_names:
+            module = self.registry.get_module(name)
+            n_fns = len(module.masks)
+            param = next(net.parameters())
+
+            # channel group ids from the layer's masks
+            group_ids = torch.empty(module.n_features, dtype=torch.long)
+            for g, mask in enumerate(module.masks):
+                group_ids[mask] = g
+
+            layer = {
+                "n_fns": n_fns,
+                "group_ids": group_ids.to(param.device),
+                "group_sizes": torch.bincount(group_ids, 
+                    minlength=n_fns).double().to(param.device),
+                "channels": [torch.nonzero(group_ids == g).flatten().to(param.device)
+                    for g in range(n_fns)],
+                "n_calls": 0,
+                "sampled": False
+            }
+            self.layers.append(layer)
+            self.reset_layer(layer, param.device)
+            
+            self.registry.add(name, self.get_input_fn(layer), "input")
+            self.registry.add(name, self.get_output_fn(layer), "output")
+
+    def reset_layer(self, layer, device):
+
+        n_fns = layer["n_fns"]
+        for key in ["count", "sum", "sq_sum", "n_sparse", "n_saturated"]:
+            layer[key] = torch.zeros(n_fns, dtype=torch.float64, device=device)
+        layer["hist"] = torch.zeros(n_fns * self.n_bins, dtype=torch.float64, 
+            device=device)
+
+    def get_input_fn(self, layer):
+        """
+        Decides whether this batch is sampled and counts saturated inputs
+        """
+        def fn(tensor):
+            
+            # deterministic sampling of a sample_rate fraction of batches
+            i = layer["n_calls"]
+            layer["n_calls"] += 1
+            layer["sampled"] = (self.net.training and 
+                np.floor((i + 1) * self.sample_rate) > np.floor(i * self.sample_rate))
+            if not layer["sampled"]:
+                return
+
+            saturated = tensor.abs() > self.sat_threshold
+            layer["n_saturated"] += segment_sum(saturated, layer["group_ids"], 
+                layer["n_fns"])
+
+        return fn
+
+    def get_output_fn(self, layer):
+        """
+        Accumulates sums, sparsity and histogram of sampled outputs. Channels
+        are reduced in the output's dtype and counts come from its shape, 
+        only the small per channel results are upcast to float64.
+        """
+        def fn(tensor):
+
+            if not layer["sampled"]:
+                return
+
+            group_ids = layer["group_ids"]
+            n_fns = layer["n_fns"]
+            
+            layer["count"] += layer["group_sizes"] * (tensor.numel() // tensor.shape[1])
+            layer["sum"] += segment_sum(tensor, group_ids, n_fns)
+            sq_norms = torch.linalg.vector_norm(tensor, 2, dim=other_dims(tensor))
+            layer["sq_sum"] += group_channels(sq_norms.double() ** 2, group_ids, n_fns)
+            layer["n_sparse"] += segment_sum(tensor.abs() <= self.sparse_eps, 
+                group_ids, n_fns)
+
+            # one histogram per cell type, out of range values in the end bins
+            (lo, hi) = self.hist_range
+            for g, channels in enumerate(layer["channels"]):
+                x = tensor.index_select(1, channels).float().clamp_(lo, hi)
+                layer["hist"][g * self.n_bins:(g + 1) * self.n_bins] += torch.histc(
+                    x, self.n_bins, lo, hi).double()
+
+        return fn
+
+    def get_log(self, net_dir, metadata=None):
+        """
+        Opens (or prepares) the run's act_stats log
+        """
+        metadata = dict(metadata) if metadata is not None else dict()
+        metadata.update({
+            "layers": self.layer_names,
+            "hist_range": list(self.hist_range),
+            "sat_threshold": self.sat_threshold,
+            "sparse_eps": self.sparse_eps,
+            "sample_rate": self.sample_rate
+        })
+
+        return MetricsLog(os.path.join(net_dir, act_stats_log_name), 
+            get_act_stats_fields(self.n_bins), metadata)
+
+    def flush(self, epoch, log):
+        """
+        Syncs the epoch's statistics off the device once, appends them to 
+        log and resets the accumulators
+        """
+        records = []
+        keys = ["count", "sum", "sq_sum", "n_sparse", "n_saturated", "hist"]
+        if len(self.layers) == 0:
+            return
+
+        # a single device to host copy for every layer
+        device = self.layers[0]["sum"].device
+        flat = torch.cat([layer[k] for layer in self.layers for k in keys])
+        flat = flat.cpu().numpy()
+        offset = 0
+        
+        for i_layer, layer in enumerate(self.layers):
+            
+            stats = dict()
+            for k in keys:
+                n = len(layer[k])
+                stats[k] = flat[offset:offset + n]
+                offset += n
+            hist = stats["hist"].reshape(layer["n_fns"], self.n_bins)
+
+            for g in range(layer["n_fns"]):
+                n = stats["count"][g]
+                record = {
+                    "epoch": epoch,
+                    "layer": i_layer,
+                    "cell_type": g,
+                    "count": n
+                }
+
+                if n > 0:
+                    mean = stats["sum"][g] / n
+                    record["mean"] = mean
+                    record["var"] = (stats["sq_sum"][g] - n * mean ** 2) / max(n - 1, 1)
+                    record["sparsity"] = stats["n_sparse"][g] / n
+                    record["saturation"] = stats["n_saturated"][g] / n
+                    for b in range(self.n_bins):
+                        record[f"hist_{b}"] = hist[g, b] / n
+
+                records.append(record)
+            
+            self.reset_layer(layer, device)
+
+        log.append(records)
+
+    def close(self):
+
+        self.registry.close()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minibatch linear CKA between saved layer responses. Responses are streamed
+from their memory-mapped .npy files a batch of stimuli at a time, and the
+unbiased HSIC estimates of every pair of files are accumulated over batches
+(Nguyen et al., 2021), so memory scales with the batch size rather than 
+the number of stimuli squared.
+"""
+import torch
+import numpy as np
+import pandas as pd
+import os
+import re
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+def init_worker():
+
+    torch.set_num_threads(1)
+
+def batch_hsic(arrs, start, stop):
+    """
+    Unbiased HSIC between the linear Gram matrices of every pair of
+    response arrays, over stimuli start:stop
+
+    Returns:
+        hsic (array): (n_arrs, n_arrs)
+    """
+    n = stop - start
+    grams = []
+    
+    for arr in arrs:
+        x = torch.from_numpy(np.asarray(arr[start:stop], dtype=np.float64))
+        x = x.reshape(n, -1)
+        gram = x @ x.T
+        gram.fill_diagonal_(0)
+        grams.append(gram)
+
+    # every pair at once, HSIC_1 being bilinear in the Gram matrices
+    grams = torch.stack(grams)
+    flat = grams.reshape(len(arrs), -1)
+    row_sums = grams.sum(dim=2)
+    sums = row_sums.sum(dim=1)
+
+    hsic = (flat @ flat.T 
+        + torch.outer(sums, sums) / ((n - 1) * (n - 2)) 
+        - 2. / (n - 2) * (row_sums @ row_sums.T)) / (n * (n - 3))
+
+    return hsic.numpy()
+
+def accumulate_hsic(task):
+    """
+    Map task for cka_matrix: sums batch_hsic over a range of stimuli
+    """
+    paths, start, stop, batch_size = task
+    arrs = [np.load(p, mmap_mode="r") for p in paths]
+    acc = np.zeros((len(paths), len(paths)))
+
+    for b_start in range(start, stop, batch_size):
+        b_stop = min(b_start + batch_size, stop)
+        
+        # unbiased estimator needs at least 4 stimuli
+        if b_stop - b_start < 4:
+            continue
+        
+        acc += batch_hsic(arrs, b_start, b_stop)
+
+    return acc
+
+def cka_matrix(paths, batch_size=256, n_workers=1):
+    """
+    Minibatch CKA between every pair of response files, which must hold 
+    responses to the same stimuli in the same order.
+
+    Args:
+        paths (list): .npy response files, (n_stimuli, ...) each.
+        batch_size (int): Stimuli per minibatch.
+        n_workers (int): Processes to split the stimuli across.
+
+    Returns:
+        cka (array): (n_files, n_files)
+    """
+    if len(paths) == 0:
+        return np.zeros((0, 0))
+
+    n_stimuli = [np.load(p, mmap_mode="r").shape[0] for p in paths]
+    if len(set(n_stimuli)) > 1:
+        raise ValueError(f"Response files have different numbers of stimuli: {n_stimuli}")
+    n_stimuli = n_stimuli[0]
+
+    # split by stimuli rather than by pair, so each worker only reads its 
+    # own rows of every file and each Gram matrix is built once, not once 
+    # per pair. Ranges are of whole batches, so batching is the same 
+    # however it's split
+    n_batches = int(np.ceil(n_stimuli / batch_size))
+    n_tasks = max(min(n_workers * 4, n_batches), 1)
+    bounds = np.linspace(0, n_batches, n_tasks + 1).astype(int) * batch_size
+    tasks = [(paths, start, min(stop, n_stimuli), batch_size) 
+        for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+
+    if n_workers <= 1 or len(tasks) <= 1:
+        results = [accumulate_hsic(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, 
+            initializer=init_worker) as executor:
+            results = list(executor.map(accumulate_hsic, tasks))
+
+    hsic = np.sum(results, axis=0)
+    self_hsic = np.sqrt(np.clip(np.diag(hsic), 0, None))
+
+    return hsic / np.outer(self_hsic, self_hsic)
+
+def find_response_files(data_dir, dataset, net_name, train_scheme, cases=None, 
+    layers=None, epoch=None):
+    """
+    Finds saved output responses under responses/, as written by 
+    NetManager.set_response_hooks
+
+    Returns:
+        files_df (dataframe): path, case, sample, epoch and layer of each.
+    """
+    resp_dir = os.path.join(data_dir, f"responses/{dataset}/{net_name}/{train_scheme}/")
+    pattern = re.compile(r"output_.*_case-(.+)_sample-(\d+)_epoch-(\d+)_(.+)\.npy$")
+    rows = []
+
+    for filepath in sorted(glob.glob(os.path.join(resp_dir, "*/sample-*/output_*.npy"))):
+        
+        match = pattern.search(os.path.basename(filepath))
+        if match is None:
+            continue
+        
+        case, sample, file_epoch, layer = match.groups()
+        if ((cases is not None and case not in cases) 
+            or (layers is not None and layer not in layers)
+            or (epoch is not None and int(file_epoch) != epoch)):
+            continue
+
+        rows.append([filepath, case, int(sample), int(file_epoch), layer])
+
+    return pd.DataFrame(rows, columns=["path", "case", "sample", "epoch", "layer"])
+
+def load_cka_df(files_df, batch_size=256, n_workers=1):
+    """
+    Minibatch CKA between every pair of the given response files, as a 
+    long-form dataframe with the identifiers of both sides of each pair
+    """
+    cka = cka_matrix(files_df["path"].to_list(), batch_size, n_workers)
+    
+    id_cols = ["case", "sample", "epoch", "layer"]
+    ids = files_df[id_cols].reset_index(drop=True)
+    (i, j) = np.meshgrid(np.arange(len(ids)), np.arange(len(ids)), indexing="ij")
+    
+    left = ids.iloc[i.ravel()].add_suffix("_x").reset_index(drop=True)
+    right = ids.iloc[j.ravel()].add_suffix("_y").reset_index(drop=True)
+    cka_df = pd.concat([left, right], axis=1)
+    cka_df["cka"] = cka.ravel()
+
+    return cka_df
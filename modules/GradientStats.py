@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gradient flow telemetry by cell type. Hooks on the weights feeding each 
+MixedActivationLayer reduce every step's gradient norm by the layer's 
+channel groups on the device, and the accumulators are synced once per 
+epoch into the run's grad_stats metrics log.
+"""
+import torch
+import numpy as np
+import os
+
+try:
+    from .MixedActivationLayer import MixedActivationLayer
+except:
+    from MixedActivationLayer import MixedActivationLayer
+
+try:
+    from .MetricsLog import MetricsLog
+except:
+    from MetricsLog import MetricsLog
+
+grad_stats_log_name = "grad_stats.mlog"
+
+grad_stats_fields = [
+    ("epoch", "<i4"),
+    ("layer", "<i4"),
+    ("cell_type", "<i4"),
+    ("n_steps", "<f8"),
+    ("mean_norm", "<f8"),
+    ("rms_norm", "<f8"),
+    ("max_norm", "<f8")
+]
+
+def get_feeding_layers(net):
+    """
+    Pairs each MixedActivationLayer with the conv or linear layer whose 
+    output channels it activates, i.e. the last weighted layer before it
+
+    Returns:
+        layers (list): (weight layer name, weight layer, act layer) tuples.
+    """
+    layers = []
+    prev = None
+
+    for name, module in net.named_modules():
+        
+        if isinstance(module, MixedActivationLayer):
+            if prev is not None and prev[1].weight.shape[0] == module.n_features:
+                layers.append((prev[0], prev[1], module))
+            prev = None
+
+        elif isinstance(getattr(module, "weight", None), torch.nn.Parameter) \
+            and module.weight.dim() >= 2:
+            prev = (name, module)
+
+    return layers
+
+class GradientStats():
+    """
+    Accumulates per cell type gradient norms of the weights feeding every
+    MixedActivationLayer in net. Frozen layers (e.g. features when training
+    from cached features) are skipped, they get no gradients.
+    """
+
+    def __init__(self, net):
+
+        self.net = net
+        self.layer_names = []
+        self.layers = []
+        self.handles = []
+
+        for name, weight_layer, act_layer in get_feeding_layers(net):
+
+            weight = weight_layer.weight
+            if not weight.requires_grad:
+                continue
+
+            group_ids = torch.empty(act_layer.n_features, dtype=torch.long)
+            for g, mask in enumerate(act_layer.masks):
+                group_ids[mask] = g
+
+            layer = {
+                "n_fns": len(act_layer.masks),
+                "group_ids": group_ids.to(weight.device)
+            }
+            self.reset_layer(layer, weight.device)
+            self.layers.append(layer)
+            self.layer_names.append(f"{name}.weight")
+            self.handles.append(weight.register_hook(self.get_hook(layer)))
+
+    def reset_layer(self, layer, device):
+
+        n_fns = layer["n_fns"]
+        layer["n_steps"] = torch.zeros(1, dtype=torch.float64, device=device)
+        for key in ["norm_sum", "sq_norm_sum", "max_norm"]:
+            layer[key] = torch.zeros(n_fns, dtype=torch.float64, device=device)
+
+    def get_hook(self, layer):
+        """
+        Reduces a step's weight gradient by output channel group, without
+        syncing with the device
+        """
+        def hook(grad):
+
+            with torch.no_grad():
+                # per channel in the grad's own dtype, groups in double
+                sq_norms = grad.reshape(len(grad), -1).pow(2).sum(-1).double()
+                sq_norms = torch.zeros(layer["n_fns"], dtype=torch.float64, 
+                    device=grad.device).index_add_(0, layer["group_ids"], sq_norms)
+                norms = torch.sqrt(sq_norms)
+                
+                layer["n_steps"] += 1
+                layer["norm_sum"] += norms
+                layer["sq_norm_sum"] += sq_norms
+                torch.maximum(layer["max_norm"], norms, out=layer["max_norm"])
+
+        return hook
+
+    def get_log(self, net_dir, metadata=None):
+        """
+        Opens (or prepares) the run's grad_stats log
+        """
+        metadata = dict(metadata) if metadata is not None else dict()
+        metadata["layers"] = self.layer_names
+
+        return MetricsLog(os.path.join(net_dir, grad_stats_log_name), 
+            grad_stats_fields, metadata)
+
+    def flush(self, epoch, log):
+        """
+        Syncs the epoch's gradient stats off the device once, appends them 
+        to log and resets the accumulators
+        """
+        keys = ["n_steps", "norm_sum", "sq_norm_sum", "max_norm"]
+        if len(self.layers) == 0:
+            return
+
+        # a single device to host copy for every layer
+        device = self.layers[0]["norm_sum"].device
+        flat = torch.cat([layer[k] for layer in self.layers for k in keys])
+        flat = flat.cpu().numpy()
+        offset = 0
+        records = []
+
+        for i_layer, layer in enumerate(self.layers):
+            
+            stats = dict()
+            for k in keys:
+                n = len(layer[k])
+                stats[k] = flat[offset:offset + n]
+                offset += n
+
+            n_steps = stats["n_steps"][0]
+            for g in range(layer["n_fns"]):
+                record = {
+                    "epoch": epoch,
+                    "layer": i_layer,
+                    "cell_type": g,
+                    "n_steps": n_steps
+                }
+
+                if n_steps > 0:
+                    record["mean_norm"] = stats["norm_sum"][g] / n_steps
+                    record["rms_norm"] = np.sqrt(stats["sq_norm_sum"][g] / n_steps)
+                    record["max_norm"] = stats["max_norm"][g]
+
+                records.append(record)
+
+            self.reset_layer(layer, device)
+
+        log.append(records)
+
+    def close(self):
+
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry of forward hooks on any set of a net's named modules, so all the
+layers of interest are recorded during a single pass over the data.
+"""
+import torch
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    from .ResponseStore import ResponseWriter
+except:
+    from ResponseStore import ResponseWriter
+
+# nesting depth of paused_hooks()
+n_paused = 0
+
+@contextmanager
+def paused_hooks():
+    """
+    Every registry's hooks are skipped inside this context, e.g. while
+    gradient checkpointing recomputes a forward pass, so nothing is 
+    recorded twice
+    """
+    global n_paused
+    n_paused += 1
+    try:
+        yield
+    finally:
+        n_paused -= 1
+
+class HookRegistry():
+    """
+    Attaches forward hooks to named modules of net. Each hook passes the
+    module's input or output, optionally reduced, to a per-layer store 
+    (anything with write(tensor) and close()) or fn. Modules are looked up
+    by name when a hook is added, so layers swapped in after construction 
+    (e.g. by replace_act_layers) are found.
+    """
+
+    def __init__(self, net):
+
+        self.net = net
+        self.hooks = dict()
+
+    def get_module(self, name):
+        """
+        The net's module with the given name, as in net.named_modules()
+        """
+        module = dict(self.net.named_modules()).get(name)
+        if module is None:
+            raise KeyError(f"No module named {name}")
+
+        return module
+
+    def find(self, module_type):
+        """
+        Returns the names of every module of the given type, in forward 
+        (registration) order, e.g. all MixedActivationLayers
+        """
+        return [name for name, module in self.net.named_modules() 
+            if isinstance(module, module_type)]
+
+    def add(self, name, fn, kind="output", reducer=None, key=None):
+        """
+        Calls fn on every batch of the named module's responses.
+
+        Args:
+            name (str): Module name, as in net.named_modules().
+            fn: Called with each (detached, reduced) batch.
+            kind (str): "input" or "output".
+            reducer: Optional fn applied to each batch first.
+            key (str): Name to register the hook under, defaults to 
+                f"{kind}_{name}".
+        """
+        module = self.get_module(name)
+        key = key if key is not None else f"{kind}_{name}"
+        if key in self.hooks:
+            raise KeyError(f"Hook {key} already registered")
+
+        def hook(module, inp, output):
+            if n_paused > 0:
+                return
+            with torch.no_grad():
+                tensor = (inp[0] if kind == "input" else output).detach()
+                if reducer is not None:
+                    tensor = reducer(tensor)
+                fn(tensor)
+
+        handle = module.register_forward_hook(hook)
+        self.hooks[key] = (handle, fn)
+
+        return key
+
+    def add_store(self, name, store, kind="output", reducer=None, key=None):
+        """
+        Streams the named module's responses into store
+        """
+        key = self.add(name, store.write, kind, reducer, key)
+        self.hooks[key] = (self.hooks[key][0], store)
+
+        return key
+
+    def add_writer(self, name, filepath, n_samples, kind="output", reducer=None,
+        dtype=np.float32, key=None):
+        """
+        Streams the named module's responses to a memory-mapped .npy file
+        """
+        return self.add_store(name, ResponseWriter(filepath, n_samples, 
+            dtype=dtype), kind, reducer, key)
+
+    def remove(self, key):
+        """
+        Removes a hook, closing its store if it has one
+        """
+        handle, target = self.hooks.pop(key)
+        handle.remove()
+        
+        if hasattr(target, "close"):
+            return target.close()
+
+    def close(self):
+        """
+        Removes every hook, closing stores. Returns each store's result 
+        (e.g. a writer's file path) by key.
+        """
+        return { key: self.remove(key) for key in list(self.hooks.keys()) }
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
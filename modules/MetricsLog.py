@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only logs of fixed-width metric records. A log file is a short JSON
+header (field names and dtypes plus any metadata) followed by packed 
+records, so appending is a single write and reading is one vectorized 
+np.fromfile, with no unpickling.
+"""
+import numpy as np
+import pandas as pd
+import os
+import json
+import struct
+
+magic = b"MLOG"
+
+# per-epoch training metrics
+perf_log_name = "perf_log.mlog"
+perf_log_fields = [
+    ("epoch", "<i4"),
+    ("val_acc", "<f8"),
+    ("val_loss", "<f8"),
+    ("train_acc", "<f8"),
+    ("train_loss", "<f8"),
+    ("wall_time", "<f8"),
+    ("throughput", "<f8")
+]
+
+class MetricsLog():
+    """
+    A single append-only metrics log file
+    """
+
+    def __init__(self, filepath, fields=None, metadata=None):
+        """
+        Args:
+            filepath (str)
+            fields (list): (name, numpy dtype string) pairs. Required if the
+                log doesn't exist yet, must match it if it does.
+            metadata (dict): JSON serializable metadata for a new log.
+        """
+        self.filepath = filepath
+        self.metadata = metadata
+        self.n_records = 0
+        self.repaired = False
+
+        if os.path.exists(filepath):
+            self.read_header()
+            if fields is not None and [tuple(f) for f in fields] != self.fields:
+                raise ValueError(f"Fields {fields} don't match log {filepath}")
+        
+        elif fields is None:
+            raise FileNotFoundError(f"No metrics log at {filepath}")
+        
+        else:
+            self.fields = [tuple(f) for f in fields]
+            self.data_start = None
+
+        self.dtype = np.dtype(self.fields)
+        if self.data_start is not None:
+            n_bytes = os.path.getsize(filepath) - self.data_start
+            self.n_records = n_bytes // self.dtype.itemsize
+
+    def read_header(self):
+
+        with open(self.filepath, "rb") as f:
+            if f.read(4) != magic:
+                raise ValueError(f"{self.filepath} is not a metrics log")
+            
+            header_len = struct.unpack("<I", f.read(4))[0]
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        self.fields = [tuple(f) for f in header["fields"]]
+        self.metadata = header.get("metadata")
+        self.data_start = 8 + header_len
+
+    def write_header(self):
+
+        header = json.dumps({ "fields": self.fields, "metadata": self.metadata })
+        header = header.encode("utf-8")
+
+        with open(self.filepath, "wb") as f:
+            f.write(magic)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+
+        self.data_start = 8 + len(header)
+
+    def repair(self):
+        """
+        Truncates a partial trailing record, e.g. left by a crash mid-write,
+        so appends stay aligned. Only done by writers, a reader could 
+        otherwise cut off an append in progress.
+        """
+        end = self.data_start + self.n_records * self.dtype.itemsize
+        if os.path.getsize(self.filepath) > end:
+            print(f"Truncating partial record at the end of {self.filepath}")
+            with open(self.filepath, "r+b") as f:
+                f.truncate(end)
+
+        self.repaired = True
+
+    def append(self, records):
+        """
+        Appends a record (dict of field values) or list of records. Missing
+        fields are written as NaN (or 0 for non-float fields).
+        """
+        if isinstance(records, dict):
+            records = [records]
+
+        if not os.path.exists(self.filepath):
+            self.write_header()
+            self.n_records = 0
+            self.repaired = True
+        elif not self.repaired:
+            self.repair()
+
+        arr = np.zeros(len(records), dtype=self.dtype)
+        for name, dtype in self.fields:
+            if np.dtype(dtype).kind == "f":
+                arr[name] = np.nan
+
+        for i, record in enumerate(records):
+            for name, val in record.items():
+                if val is not None:
+                    arr[i][name] = val
+
+        # one write per append, so readers only ever see whole records
+        with open(self.filepath, "ab") as f:
+            f.write(arr.tobytes())
+        self.n_records += len(records)
+
+    def read(self):
+        """
+        Returns every complete record as a numpy structured array
+        """
+        n_bytes = os.path.getsize(self.filepath) - self.data_start
+        count = n_bytes // self.dtype.itemsize
+
+        return np.fromfile(self.filepath, dtype=self.dtype, count=count, 
+            offset=self.data_start)
+
+    def read_df(self):
+
+        return pd.DataFrame(self.read())
+
+def read_perf_log(filepath):
+    """
+    Reads a perf log as a dataframe with one row per epoch, keeping the 
+    latest record for any epoch logged more than once (e.g. on resume)
+    """
+    df = MetricsLog(filepath).read_df()
+    df = df.drop_duplicates("epoch", keep="last").sort_values("epoch")
+
+    return df.reset_index(drop=True)
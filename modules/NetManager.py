@@ -17,6 +17,8 @@ import torch.optim as optim
 from torch.optim import lr_scheduler
 import random
 import sys
+from contextlib import nullcontext
+from torch.utils.checkpoint import checkpoint
 
 try:
     from .MixedActivationLayer import MixedActivationLayer
@@ -28,6 +30,56 @@ try:
 except:
     from StickNet import StickNet
 
+try:
+    from .SnapshotIO import save_snapshot, load_snapshot, load_snapshot_metadata, snapshot_ext
+except:
+    from SnapshotIO import save_snapshot, load_snapshot, load_snapshot_metadata, snapshot_ext
+
+try:
+    from .WeightSummary import save_weight_summary, get_summary_path, is_weight
+except:
+    from WeightSummary import save_weight_summary, get_summary_path, is_weight
+
+try:
+    from .WeightCache import WeightCache
+except:
+    from WeightCache import WeightCache
+
+try:
+    from .SnapshotIndex import SnapshotIndex
+except:
+    from SnapshotIndex import SnapshotIndex
+
+try:
+    from .HookRegistry import HookRegistry, paused_hooks
+except:
+    from HookRegistry import HookRegistry, paused_hooks
+
+try:
+    from .Quantization import quantize_net, get_calibration_batches
+except:
+    from Quantization import quantize_net, get_calibration_batches
+
+try:
+    from .ResponseStore import CompressedResponseWriter, rsp_ext
+except:
+    from ResponseStore import CompressedResponseWriter, rsp_ext
+
+try:
+    from .ActivationStats import ActivationStats
+except:
+    from ActivationStats import ActivationStats
+
+try:
+    from .GradientStats import GradientStats
+except:
+    from GradientStats import GradientStats
+
+try:
+    from .MetricsLog import MetricsLog, perf_log_name, perf_log_fields, read_perf_log
+except:
+    from MetricsLog import MetricsLog, perf_log_name, perf_log_fields, read_perf_log
+
 try:
     from .util import *
 except:
@@ -73,6 +125,57 @@ nets = {
     }
 }
 
+# vgg11_cifar shares vgg11's layer layout, only the classifier is smaller
+nets["vgg11_cifar"] = copy.deepcopy(nets["vgg11"])
+
+def cifar_classifier(n_features, n_hidden=512):
+    """
+    Builds a vgg-style classifier sized for the 1x1x512 feature map vgg11
+    produces on 32x32 input. Keeps torchvision's layer positions so state
+    keys and layers_of_interest still line up.
+    """
+    return nn.Sequential(
+        nn.Linear(n_features, n_hidden),
+        nn.ReLU(True),
+        nn.Dropout(),
+        nn.Linear(n_hidden, n_hidden),
+        nn.ReLU(True),
+        nn.Dropout(),
+        nn.Linear(n_hidden, 1000)
+    )
+
+# optimizer state kept per parameter, in parameter sized tensors
+optimizer_state_sizes = {
+    "sgd": 1,
+    "adam": 2
+}
+
+# default learning rate scaling rule for each training scheme
+lr_scaling_rules = {
+    "sgd": "linear",
+    "adam": "sqrt"
+}
+
+def scale_lr(lr, batch_size, base_batch_size, rule="linear"):
+    """
+    Scales a learning rate tuned for base_batch_size to batch_size.
+
+    "linear" multiplies it by batch_size / base_batch_size, the usual rule
+    for SGD (Goyal et al. 2017). "sqrt" multiplies it by the square root of
+    that ratio, which keeps the update variance roughly constant and suits 
+    adaptive optimizers like Adam better. "none" leaves it alone.
+    """
+    ratio = batch_size / base_batch_size
+
+    if rule == "linear":
+        return lr * ratio
+    elif rule == "sqrt":
+        return lr * math.sqrt(ratio)
+    elif rule == "none":
+        return lr
+
+    raise ValueError(f"Unknown learning rate scaling rule: {rule}")
+
 def replace_act_layers(model, n_repeat, act_fns, act_fn_params):
     """
     Recursive helper function to replace all relu layers with
@@ -104,7 +207,7 @@ def replace_act_layers(model, n_repeat, act_fns, act_fn_params):
 class NetManager():
     
     def __init__(self, dataset, net_name, n_classes, data_dir, train_scheme, 
-        pretrained=False, seed=None):
+        pretrained=False, seed=None, offline=False):
 
         # SEED!
         self.seed_everything(seed)
@@ -118,6 +221,18 @@ class NetManager():
         self.epoch = 0
         self.modified_layers = None
         self.perf_stats = []
+        self.perf_log = None
+        self.cached_features = False
+        self.write_summaries = False
+        self.hook_registry = None
+        self.act_stats = None
+        self.grad_stats = None
+        self.checkpoint_segments = None
+        self.checkpoint_inputs = None
+        self.batch_config = None
+        self.calibration_batches = None
+        self.weight_cache = WeightCache(self.data_dir, offline)
+        self.snapshot_index = SnapshotIndex(self.data_dir)
 
         if (torch.cuda.is_available()):
             print("Enabling GPU speedup!")
@@ -134,37 +249,103 @@ class NetManager():
         random.seed()
         torch.manual_seed(seed)
 
-    def init_net(self, case_id, sample):
+    def init_net(self, case_id, sample, init_weights=True):
+        """
+        Builds the net for the given case and sample.
+
+        Args:
+            case_id (str)
+            sample (int)
+            init_weights (bool): If False, skip random init and pretrained 
+                weights entirely. Only for nets about to have state loaded.
+        """
         self.case_id = case_id
         self.sample = sample
         self.net_dir = get_net_dir(self.data_dir, self.dataset, self.net_name, 
             self.train_scheme, self.case_id, self.sample)
 
-        if self.pretrained:
+        if init_weights:
+            self.net = self.build_net(self.pretrained)
+        else:
+            with skip_weight_init():
+                self.net = self.build_net(False)
+
+        self.net = self.net.to(self.device)
+
+    def build_net(self, pretrained):
+        """
+        Constructs a fresh instance of self.net_name with its output layer
+        sized for n_classes
+        """
+        if pretrained:
             print("Initializing pretrained net!")
 
         if self.net_name == "vgg11":
-            self.net = models.vgg11(pretrained=self.pretrained)
-        
+            net = self.build_vgg11(pretrained)
+
+        elif self.net_name == "vgg11_cifar":
+            # pool straight to 1x1 instead of replicating it up to 7x7
+            net = self.build_vgg11(pretrained)
+            net.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+            net.classifier = cifar_classifier(512)
+
         elif self.net_name == "sticknet8":
-            self.net = StickNet(8)
+            net = StickNet(8)
 
         else:
             print(f"Unrecognized network name {self.net_name}, exiting job.")
             sys.exit(-1)
-            
+
         # update net's output layer to match n_classes
-        n_features = self.net.classifier[-1].in_features
-        self.net.classifier[-1] = nn.Linear(n_features, self.n_classes)
-        self.net = self.net.to(self.device)
+        n_features = net.classifier[-1].in_features
+        net.classifier[-1] = nn.Linear(n_features, self.n_classes)
+
+        return net
+
+    def build_vgg11(self, pretrained):
+        """
+        Builds a vgg11, copying pretrained weights in from the weight cache
+        rather than having torchvision deserialize them for every net
+        """
+        if not pretrained:
+            return models.vgg11()
+
+        # random init would just be overwritten
+        with skip_weight_init():
+            net = models.vgg11()
+
+        net.load_state_dict(self.weight_cache.get_state("vgg11"))
+
+        return net
+
+    def materialize_net(self, state_dict):
+        """
+        Builds the net for the current case and sample directly from 
+        state_dict. Construction skips random init and pretrained weights, 
+        and any activation layer modifications are applied before the state
+        is loaded, so the graph is only built once.
+        """
+        self.init_net(self.case_id, self.sample, init_weights=False)
+        
+        # make any modifications
+        if self.modified_layers is not None:
+            n_repeat = self.modified_layers["n_repeat"]
+            act_fns = self.modified_layers["act_fns"]
+            act_fn_params = self.modified_layers["act_fn_params"]
+            self.replace_act_layers(n_repeat, act_fns, act_fn_params)
+
+        self.net.load_state_dict(state_dict)
+        self.net.eval()
+
+        return self.net
     
     def save_net_snapshot(self, epoch=0, val_acc=None):
         
         net_tag = get_net_tag(self.net_name, self.case_id, self.sample, epoch)
-        filename = f"{net_tag}.pt"
+        filename = f"{net_tag}{snapshot_ext}"
         net_filepath = os.path.join(self.net_dir, filename)
         
-        snapshot_state = {
+        metadata = {
             "dataset": self.dataset,
             "net_name": self.net_name,
             "epoch": epoch,
@@ -172,13 +353,52 @@ class NetManager():
             "case": self.case_id,
             "sample": self.sample,
             "val_acc": val_acc,
-            "state_dict": self.net.state_dict(),
-            "modified_layers": self.modified_layers
+            "modified_layers": self.modified_layers,
+            "batch_config": self.batch_config
         }
 
         print(f"Saving network snapshot {filename}")
-        torch.save(snapshot_state, net_filepath)
+        save_snapshot(net_filepath, metadata, self.net.state_dict())
+        if self.write_summaries:
+            self.save_weight_summary(net_filepath, metadata)
+        self.snapshot_index.add_file(net_filepath, {
+            "dataset": self.dataset,
+            "net_name": self.net_name,
+            "train_scheme": self.train_scheme,
+            "case_id": self.case_id,
+            "sample": self.sample,
+            "epoch": epoch,
+            "val_acc": val_acc
+        })
     
+    def save_weight_summary(self, net_filepath, metadata):
+        """
+        Writes a sidecar of weight summary stats for the snapshot at 
+        net_filepath, including changes since epoch 0
+        """
+        state_dict = { k: v for k, v in self.net.state_dict().items() 
+            if is_weight(k) }
+
+        # epoch 0 weights are mapped from disk each time, not held in memory
+        save_weight_summary(net_filepath, metadata, state_dict, 
+            self.load_initial_weights())
+        self.snapshot_index.add_file(get_summary_path(net_filepath))
+
+    def load_initial_weights(self):
+        """
+        Loads the current run's epoch 0 weights from disk (memory-mapped, 
+        so pages are only read as they're used), or None if there is no 
+        epoch 0 snapshot
+        """
+        net_tag = get_net_tag(self.net_name, self.case_id, self.sample, 0)
+        
+        for ext in [snapshot_ext, ".pt"]:
+            net_filepath = os.path.join(self.net_dir, f"{net_tag}{ext}")
+            if os.path.exists(net_filepath):
+                return load_snapshot(net_filepath, is_weight)["state_dict"]
+
+        return None
+
     def save_arr(self, name, np_arr):
         """
         Save a generic numpy array in the current net's output location
@@ -201,6 +421,7 @@ class NetManager():
 
         # save
         np.save(filepath, data)
+        self.snapshot_index.add_file(filepath)
 
     def load_net_state(self, case_id, sample, epoch, state_dict):
         """
@@ -218,22 +439,14 @@ class NetManager():
         """
         
         self.epoch = epoch
-        self.init_net(case_id, sample)
-        self.net.load_state_dict(state_dict)
-        self.net.eval()
-        
-        # make any modifications
-        if self.modified_layers is not None:
-            n_repeat = self.modified_layers["n_repeat"]
-            act_fns = self.modified_layers["act_fns"]
-            act_fn_params = self.modified_layers["act_fn_params"]
-            self.replace_act_layers(n_repeat, act_fns, act_fn_params)
+        self.case_id = case_id
+        self.sample = sample
 
-        return self.net
+        return self.materialize_net(state_dict)
         
     def load_net_snapshot_from_path(self, net_filepath):
         # load snapshot
-        snapshot_state = torch.load(net_filepath, map_location=self.device)
+        snapshot_state = load_snapshot(net_filepath, map_location=self.device)
         
         # extract state
         state_dict = snapshot_state.get("state_dict")
@@ -243,30 +456,31 @@ class NetManager():
         self.dataset = snapshot_state.get("dataset") if snapshot_state.get("dataset") is not None else "imagenette2"
         self.modified_layers = snapshot_state.get("modified_layers")        
         self.epoch = snapshot_state.get("epoch")
+        self.batch_config = snapshot_state.get("batch_config")
         
         # load net state
-        self.init_net(self.case_id, self.sample)
-        self.net.load_state_dict(state_dict)
-        self.net.eval()
-        
-        # make any modifications
-        if self.modified_layers is not None:
-            n_repeat = self.modified_layers["n_repeat"]
-            act_fns = self.modified_layers["act_fns"]
-            act_fn_params = self.modified_layers["act_fn_params"]
-            self.replace_act_layers(n_repeat, act_fns, act_fn_params)
+        self.materialize_net(state_dict)
         
         # print net summary
         print(self.net)
 
         return self.net
     
-    def load_snapshot_metadata(self, net_filepath, include_state=False):
-        # load snapshot
-        snapshot_state = torch.load(net_filepath, map_location=self.device)
-        
+    def load_snapshot_metadata(self, net_filepath, include_state=False, 
+        state_keys=None):
+        """
+        Loads a snapshot's metadata, and optionally its state. 
+
+        Args:
+            net_filepath (str)
+            include_state (bool): Return the full snapshot, state included.
+            state_keys: Names of (or a predicate on) the state tensors to 
+                load, all of them if None. Other tensors are never read.
+        """
         if include_state:
-            return snapshot_state
+            return load_snapshot(net_filepath, state_keys, self.device)
+        
+        snapshot_state = load_snapshot_metadata(net_filepath)
         
         return {
             "epoch": snapshot_state.get("epoch"),
@@ -283,29 +497,364 @@ class NetManager():
          self.val_loader) = load_dataset(self.data_dir, self.dataset, 
             batch_size)
 
-    def save_net_responses(self):
-        # store responses as tensor
-        self.responses_input = torch.stack(self.responses_input)
-        self.responses_output = torch.stack(self.responses_output)
+    def set_batch_size(self, batch_size):
+        """
+        Rebuilds the data loaders over the already loaded datasets with a 
+        new batch size
+        """
+        self.train_loader = torch.utils.data.DataLoader(self.train_set, 
+            batch_size=batch_size, shuffle=True, 
+            num_workers=self.train_loader.num_workers)
+        self.val_loader = torch.utils.data.DataLoader(self.val_set, 
+            batch_size=batch_size, shuffle=False, 
+            num_workers=self.val_loader.num_workers)
+
+    def measure_step_memory(self, inputs, labels, criterion):
+        """
+        Peak memory of one forward/backward step in bytes. On gpu this is the
+        allocator's peak. On cpu it's only the activations saved for 
+        backward, which is what grows with batch size, including the 
+        segment inputs checkpointing keeps.
+        """
+        inputs = inputs.to(self.device)
+        labels = labels.to(self.device)
+        self.net.zero_grad()
+
+        if self.device.type == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            criterion(self.run_net(inputs), labels).backward()
+            torch.cuda.synchronize()
+            return torch.cuda.max_memory_allocated()
+
+        # count each storage once, views share them
+        saved = dict()
+        def pack(tensor):
+            storage = tensor.untyped_storage()
+            saved[storage.data_ptr()] = storage.nbytes()
+            return tensor
+
+        self.checkpoint_inputs = []
+        try:
+            with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+                outputs = self.run_net(inputs)
+            for tensor in self.checkpoint_inputs:
+                pack(tensor)
+            criterion(outputs, labels).backward()
+        finally:
+            self.checkpoint_inputs = None
+
+        return sum(saved.values())
+
+    def get_memory_budget(self, frac=0.9):
+        """
+        Default memory budget for batch size probing: frac of the gpu's memory
+        """
+        if self.device.type != "cuda":
+            raise ValueError("A memory budget is required on cpu")
+
+        return int(frac * torch.cuda.get_device_properties(
+            self.device).total_memory)
+
+    def find_max_batch_size(self, memory_budget=None, start=8, 
+        max_batch_size=1024, multiple_of=8, n_steps=2):
+        """
+        Finds the largest batch size whose training step fits in 
+        memory_budget. Runs n_steps forward/backward steps on random inputs
+        shaped like the training set's, doubling the batch size from start 
+        until a step doesn't fit, then bisecting down to multiple_of. 
+        Weights are untouched, hooks are paused and the RNG state is 
+        restored, so probing doesn't change the run.
+
+        Args:
+            memory_budget (int): Bytes, defaults to 90% of the gpu's memory.
+                Required on cpu, where it's compared against saved 
+                activations plus weights, gradients and optimizer state.
+            start (int)
+            max_batch_size (int)
+            multiple_of (int): Resolution of the search.
+            n_steps (int)
+
+        Returns:
+            batch_size (int)
+            peak_memory (int): Bytes used at that batch size.
+        """
+        if memory_budget is None:
+            memory_budget = self.get_memory_budget()
+
+        criterion = nn.CrossEntropyLoss()
+        (sample, _) = self.train_set[0]
+        max_batch_size = min(max_batch_size, len(self.train_set))
+        params = list(self.net.parameters())
+        param_bytes = sum(p.numel() * p.element_size() for p in params)
+        n_state = optimizer_state_sizes.get(self.train_scheme, 2)
+        generator = torch.Generator().manual_seed(0)
+        was_training = self.net.training
+        self.net.train()
+
+        def measure(batch_size):
+            inputs = torch.randn((batch_size,) + tuple(sample.shape), 
+                generator=generator)
+            labels = torch.randint(self.n_classes, (batch_size,), 
+                generator=generator)
+            try:
+                memory = max(self.measure_step_memory(inputs, labels, criterion)
+                    for i in range(n_steps))
+            except RuntimeError as e:
+                if "out of memory" not in str(e):
+                    raise
+                memory = float("inf")
+            finally:
+                self.net.zero_grad(set_to_none=True)
+                if self.device.type == "cuda":
+                    torch.cuda.empty_cache()
+
+            # optimizer state isn't allocated yet, and on cpu neither 
+            # weights nor gradients are measured
+            memory += n_state * param_bytes
+            if self.device.type != "cuda":
+                memory += 2 * param_bytes
+            print(f"Batch size {batch_size}: {memory / 2**20:.1f} MB")
+
+            return memory
+
+        devices = [self.device] if self.device.type == "cuda" else []
+        with torch.random.fork_rng(devices=devices), paused_hooks():
+
+            # grow until a step doesn't fit
+            (fit, fit_memory) = (None, None)
+            batch_size = start
+            while True:
+                memory = measure(batch_size)
+                if memory > memory_budget:
+                    break
+                (fit, fit_memory) = (batch_size, memory)
+                if batch_size >= max_batch_size:
+                    break
+                batch_size = min(batch_size * 2, max_batch_size)
+
+            if fit is None:
+                raise RuntimeError(f"Batch size {start} doesn't fit in " 
+                    + f"{memory_budget / 2**20:.1f} MB")
+
+            # bisect between the last fit and the first miss
+            (lo, hi) = (fit, batch_size)
+            while hi - lo > multiple_of:
+                mid = (lo + hi) // 2 // multiple_of * multiple_of
+                if mid <= lo:
+                    break
+                memory = measure(mid)
+                if memory > memory_budget:
+                    hi = mid
+                else:
+                    (lo, fit_memory) = (mid, memory)
+
+        self.net.train(was_training)
+
+        return lo, fit_memory
+
+    def auto_batch_size(self, base_batch_size, base_lr, lr_rule="linear", 
+        memory_budget=None, **kwargs):
+        """
+        Switches to the largest batch size that fits in memory_budget, 
+        scaling the learning rate tuned for base_batch_size with lr_rule 
+        (see scale_lr). The choice is recorded in every snapshot's metadata
+        as batch_config.
+
+        Returns:
+            batch_size (int)
+            lr (float)
+        """
+        if memory_budget is None:
+            memory_budget = self.get_memory_budget()
+
+        batch_size, peak_memory = self.find_max_batch_size(memory_budget, 
+            **kwargs)
+        lr = scale_lr(base_lr, batch_size, base_batch_size, lr_rule)
+
+        self.batch_config = {
+            "batch_size": batch_size,
+            "lr": lr,
+            "base_batch_size": base_batch_size,
+            "base_lr": base_lr,
+            "lr_rule": lr_rule,
+            "memory_budget": memory_budget,
+            "peak_memory": peak_memory
+        }
+        print(f"Using batch size {batch_size} and learning rate {lr}")
+        self.set_batch_size(batch_size)
+
+        return batch_size, lr
+
+    def freeze_features(self):
+        """
+        Freezes the net's feature layers so only the classifier trains
+        """
+        for param in self.net.features.parameters():
+            param.requires_grad = False
+
+    def extract_features(self, inputs):
+        """
+        Runs inputs through the feature layers and pooling, returning the 
+        flattened features the classifier consumes
+        """
+        x = self.net.features(inputs)
+        x = self.net.avgpool(x)
+        return torch.flatten(x, 1)
+
+    def run_net(self, inputs):
+        """
+        Runs the net forward, skipping the feature layers if training
+        from cached features
+        """
+        if self.cached_features:
+            return self.net.classifier(inputs)
+
+        if (self.checkpoint_segments is not None and self.net.training 
+            and torch.is_grad_enabled()):
+            return self.run_checkpointed(inputs)
+
+        return self.net(inputs)
+
+    def set_checkpointing(self, n_segments):
+        """
+        Trades compute for memory during training: net.features is split 
+        into n_segments contiguous segments and only each segment's input is
+        kept through the forward pass. All but the last segment are 
+        recomputed during backward. None turns checkpointing off.
+        """
+        if n_segments is not None and n_segments < 1:
+            raise ValueError(f"Need at least one segment, got {n_segments}")
+
+        self.checkpoint_segments = n_segments
+
+    def run_checkpointed(self, inputs):
+        """
+        Runs the net forward with its feature layers checkpointed in 
+        segments. Hooks are paused while a segment is recomputed, so
+        activation stats and responses only see each batch once.
+        """
+        layers = list(self.net.features.children())
+        n_segments = min(self.checkpoint_segments, len(layers))
+        bounds = np.linspace(0, len(layers), n_segments + 1).astype(int)
+
+        # an in-place layer would overwrite the input its segment's 
+        # checkpoint saved, so start segments after it instead
+        for i in range(1, n_segments):
+            while (bounds[i] < len(layers) 
+                and getattr(layers[bounds[i]], "inplace", False)):
+                bounds[i] += 1
+        bounds = np.unique(bounds)
+
+        def run_segment(start, end):
+            def fn(x):
+                for layer in layers[start:end]:
+                    x = layer(x)
+                return x
+            return fn
+
+        # the last segment's activations are needed right away in backward
+        x = inputs
+        for start, end in zip(bounds[:-2], bounds[1:-1]):
+
+            # kept by checkpoint itself, out of sight of saved tensor hooks
+            if self.checkpoint_inputs is not None:
+                self.checkpoint_inputs.append(x)
+            x = checkpoint(run_segment(start, end), x, use_reentrant=False,
+                context_fn=lambda: (nullcontext(), paused_hooks()))
+        x = run_segment(bounds[-2], bounds[-1])(x)
+
+        x = self.net.avgpool(x)
+        x = torch.flatten(x, 1)
+
+        return self.net.classifier(x)
+
+    def cache_features(self, batch_size):
+        """
+        Freezes the feature layers, runs the train and val sets through them
+        once and caches the pooled features to memory-mapped files. The data 
+        loaders are then swapped for ones over the cache so the classifier 
+        can be trained directly from it.
+
+        Training images go through the deterministic val transforms, since 
+        augmentation can't be cached. Snapshots still contain the full net.
+        """
+        self.freeze_features()
+
+        cache_dir = get_feature_cache_dir(self.data_dir, self.dataset, 
+            self.net_name, self.train_scheme, self.case_id, self.sample)
+
+        # features are frozen, so an existing cache is still valid
+        if not all(os.path.exists(os.path.join(cache_dir, f"{phase}_labels.npy"))
+            for phase in ["train", "val"]):
+
+            (_, _, train_loader, val_loader) = load_dataset(self.data_dir, 
+                self.dataset, batch_size, augment=False)
+            self.write_feature_cache(train_loader, cache_dir, "train")
+            self.write_feature_cache(val_loader, cache_dir, "val")
         
-        # output location
-        net_tag = get_net_tag(self.net_name)
-        output_filename = f"output_{net_tag}.pt"
-        input_filename = f"input_{net_tag}.pt"
-        resp_dir = os.path.join(self.data_dir, 
+        else:
+            print(f"Using existing feature cache in {cache_dir}")
+
+        (self.train_set, 
+         self.val_set, 
+         self.train_loader, 
+         self.val_loader) = load_feature_cache(cache_dir, batch_size)
+
+        self.cached_features = True
+
+    def write_feature_cache(self, loader, cache_dir, phase):
+        """
+        Streams features for every sample in loader into a memory-mapped
+        .npy file in cache_dir
+        """
+        features_path = os.path.join(cache_dir, f"{phase}_features.npy")
+        labels_path = os.path.join(cache_dir, f"{phase}_labels.npy")
+        tmp_path = features_path + ".tmp"
+        print(f"Caching {phase} features to {features_path}")
+
+        self.net.eval()
+        n_samples = len(loader.dataset)
+        features = None
+        labels = np.empty(n_samples, dtype=np.int64)
+        i = 0
+
+        with torch.no_grad():
+            for inputs, batch_labels in loader:
+                outputs = self.extract_features(inputs.to(self.device))
+                outputs = outputs.cpu().numpy()
+
+                # allocate once the feature size is known
+                if features is None:
+                    features = np.lib.format.open_memmap(tmp_path, mode="w+",
+                        dtype=np.float32, shape=(n_samples, outputs.shape[1]))
+
+                n = len(outputs)
+                features[i:i + n] = outputs
+                labels[i:i + n] = batch_labels.numpy()
+                i += n
+
+        features.flush()
+        del features
+
+        # labels last, they mark the cache as complete
+        os.replace(tmp_path, features_path)
+        np.save(labels_path, labels)
+
+    def get_responses_dir(self):
+
+        return ensure_sub_dir(self.data_dir, 
             f"responses/{self.dataset}/{self.net_name}/{self.train_scheme}/{self.case_id}/sample-{self.sample}/")
-        
-        print(f"Saving network responses to {resp_dir}")
 
-        if not os.path.exists(resp_dir):
-            os.makedirs(resp_dir)
-        
-        output_filepath = os.path.join(resp_dir, output_filename)
-        input_filepath = os.path.join(resp_dir, input_filename)
-        
-        # save
-        torch.save(self.responses_output, output_filepath)
-        torch.save(self.responses_input, input_filepath)
+    def save_net_responses(self):
+        """
+        Finishes writing all captured responses and removes their hooks
+        """
+        print(f"Saving network responses to {self.get_responses_dir()}")
+
+        if self.hook_registry is not None:
+            self.hook_registry.close()
+            self.hook_registry = None
         
     def replace_act_layers(self, n_repeat, act_fns, act_fn_params):
         """
@@ -323,55 +872,122 @@ class NetManager():
         self.net = replace_act_layers(self.net, n_repeat, act_fns, 
             act_fn_params)
     
-    def set_input_hook(self, layer_name):
-        # store responses here...
-        self.responses_input = []
-        
-        # define hook fn
-        def input_hook(module, inp, output):
-            self.responses_input.append(inp)
-        
-        # just hook up single layer for now
-        i_layer = nets[self.net_name]["layers_of_interest"][layer_name]
+    def get_hook_registry(self):
+        """
+        The registry of hooks on the current net. A registry left on a 
+        previous net is closed first, removing its hooks and closing its
+        stores.
+        """
+        if self.hook_registry is not None and self.hook_registry.net is not self.net:
+            self.hook_registry.close()
+            self.hook_registry = None
+
+        if self.hook_registry is None:
+            self.hook_registry = HookRegistry(self.net)
+
+        return self.hook_registry
+
+    def get_module_name(self, layer_name):
+        """
+        Resolves one of the net's layers_of_interest to its module name,
+        passing through anything that's already a module name
+        """
+        layers_of_interest = nets.get(self.net_name, dict()).get("layers_of_interest", dict())
+        if layer_name not in layers_of_interest:
+            return layer_name
+
+        i_layer = layers_of_interest[layer_name]
         if i_layer < len(self.net.features):
             # target layer is in "features"
-            self.net.features[i_layer].register_forward_hook(input_hook)
-            
+            container_name = "features"
+
         else:
             # target layer must be in fc layers under "classifier"
             i_layer = i_layer - len(self.net.features)
-            self.net.classifier[i_layer].register_forward_hook(input_hook)
+            container_name = "classifier"
         
         # set ReLU layer in place rectification to false to get unrectified responses
-        potential_relu_layer = self.net.features[i_layer + 1]
-        if isinstance(potential_relu_layer, nn.ReLU):
-            print("Setting inplace rectification to false!")
-            potential_relu_layer.inplace = False
-    
-    def set_output_hook(self, layer_name):
-        # store responses here...
-        self.responses_output = []
-        
-        # define hook fn
-        def output_hook(module, inp, output):
-            self.responses_output.append(output)
+        container = getattr(self.net, container_name)
+        if i_layer + 1 < len(container):
+            potential_relu_layer = container[i_layer + 1]
+            if isinstance(potential_relu_layer, nn.ReLU):
+                print("Setting inplace rectification to false!")
+                potential_relu_layer.inplace = False
+
+        return f"{container_name}.{i_layer}"
+
+    def get_act_layer_names(self):
+        """
+        Names of every MixedActivationLayer in the net, in forward order
+        """
+        return self.get_hook_registry().find(MixedActivationLayer)
+
+    def set_response_hooks(self, layer_names, kind="output", n_samples=None, 
+        reducers=None, dtype=np.float32, compression=None):
+        """
+        Streams the input or output responses of several layers to 
+        responses/.../{kind}_{net_tag}_{layer_name}.npy (or .rsp if 
+        compressed), all recorded in the same forward passes.
+
+        Args:
+            layer_names (list): layers_of_interest or module names (e.g.
+                from get_act_layer_names).
+            kind (str): "input" or "output".
+            n_samples (int): Responses to make room for, defaults to the 
+                size of the validation set.
+            reducers: Optional fn applied to each batch (e.g. spatial_mean), 
+                or a dict of layer name to fn.
+            dtype: Type responses are stored as.
+            compression (str): Store responses chunk-compressed and 
+                quantized to "int8", "fp16" or "fp32" instead.
+        """
+        if n_samples is None:
+            n_samples = len(self.val_set)
+
+        registry = self.get_hook_registry()
+        resp_dir = self.get_responses_dir()
+        net_tag = get_net_tag(self.net_name, self.case_id, self.sample, self.epoch)
         
-        # just hook up single layer for now
-        i_layer = nets[self.net_name]["layers_of_interest"][layer_name]
-        if i_layer < len(self.net.features):
-            # target layer is in "features"
-            self.net.features[i_layer].register_forward_hook(output_hook)
-            
-        else:
-            # target layer must be in fc layers under "classifier"
-            i_layer = i_layer - len(self.net.features)
-            self.net.classifier[i_layer].register_forward_hook(output_hook)
+        for layer_name in layer_names:
+            reducer = reducers.get(layer_name) if isinstance(reducers, dict) else reducers
+            module_name = self.get_module_name(layer_name)
+            key = f"{kind}_{layer_name}"
+
+            if compression is not None:
+                filepath = os.path.join(resp_dir, f"{kind}_{net_tag}_{layer_name}{rsp_ext}")
+                registry.add_store(module_name, CompressedResponseWriter(filepath, 
+                    compression), kind, reducer, key)
+                continue
+
+            filepath = os.path.join(resp_dir, f"{kind}_{net_tag}_{layer_name}.npy")
+            registry.add_writer(module_name, filepath, n_samples, kind, reducer, 
+                dtype, key)
+
+    def set_input_hook(self, layer_name, n_samples=None, reducer=None, 
+        dtype=np.float32):
+
+        self.set_response_hooks([layer_name], "input", n_samples, reducer, dtype)
+    
+    def set_output_hook(self, layer_name, n_samples=None, reducer=None, 
+        dtype=np.float32):
         
-        # set ReLU layer in place rectification to false to get unrectified responses
-        potential_relu_layer = self.net.features[i_layer + 1]
-        if isinstance(potential_relu_layer, nn.ReLU):
-            print("Setting inplace rectification to false!")
-            potential_relu_layer.inplace = False
+        self.set_response_hooks([layer_name], "output", n_samples, reducer, dtype)
+
+    def capture_responses(self, layer_names, kind="output", reducers=None, 
+        dtype=np.float32, compression=None):
+        """
+        Records responses of all the given layers over the validation set 
+        in a single pass
+        """
+        self.set_response_hooks(layer_names, kind, len(self.val_set), reducers, 
+            dtype, compression)
+        self.net.eval()
+
+        with torch.no_grad():
+            for inputs, labels in self.val_loader:
+                self.run_net(inputs.to(self.device))
+
+        self.save_net_responses()
         
     def evaluate_net(self, criterion):
         # set to validate mode
@@ -387,7 +1003,7 @@ class NetManager():
 
             # run net forward
             with torch.set_grad_enabled(False):
-                outputs = self.net(inputs)
+                outputs = self.run_net(inputs)
                 _, preds = torch.max(outputs, 1)
                 loss = criterion(outputs, labels)
 
@@ -404,6 +1020,72 @@ class NetManager():
         
         return (epoch_acc.item(), epoch_loss)
     
+    def get_calibration_batches(self, n_samples=256):
+        """
+        A fixed slice of the training set for calibrating static 
+        quantization, decoded on first use and reused by every net after
+        """
+        if self.calibration_batches is None:
+            self.calibration_batches = get_calibration_batches(self.train_set, 
+                n_samples, self.val_loader.batch_size)
+
+        return self.calibration_batches
+
+    def quantize(self, static_convs=False):
+        """
+        Swaps the net for an int8 copy for faster CPU evaluation: dynamic
+        quantization of Linear layers, and optionally static quantization 
+        of convs calibrated on a slice of the training set. Only for 
+        inference, the net runs on CPU from here on.
+        """
+        calibration_batches = self.get_calibration_batches() if static_convs else None
+        self.device = torch.device("cpu")
+        self.net = quantize_net(self.net, calibration_batches, static_convs)
+
+        return self.net
+
+    def evaluate_quantized(self, criterion, static_convs=False):
+        """
+        Evaluates the net in fp32 and int8 on CPU and reports the 
+        difference. The manager's net and device are restored afterwards.
+
+        Returns:
+            results (dict): Accuracy, loss and evaluation time of each, 
+                plus acc_delta (int8 - fp32) and speedup.
+        """
+        (net, device) = (self.net, self.device)
+        self.device = torch.device("cpu")
+        self.net = self.net.cpu()
+
+        try:
+            since = time.time()
+            (fp32_acc, fp32_loss) = self.evaluate_net(criterion)
+            fp32_time = time.time() - since
+
+            self.quantize(static_convs)
+            since = time.time()
+            (int8_acc, int8_loss) = self.evaluate_net(criterion)
+            int8_time = time.time() - since
+
+        finally:
+            self.device = device
+            self.net = net.to(device)
+
+        results = {
+            "fp32_acc": fp32_acc,
+            "fp32_loss": fp32_loss,
+            "fp32_time": fp32_time,
+            "int8_acc": int8_acc,
+            "int8_loss": int8_loss,
+            "int8_time": int8_time,
+            "acc_delta": int8_acc - fp32_acc,
+            "speedup": fp32_time / int8_time
+        }
+        print(f"int8 accuracy delta: {results['acc_delta']:+.6f}, " 
+            + f"speedup: {results['speedup']:.2f}x")
+
+        return results
+
     def train_net(self, criterion, optimizer, scheduler, train_frac):
         """
         Run a single training epoch
@@ -429,7 +1111,7 @@ class NetManager():
         train_limit = len(self.train_loader) * train_frac
 
         for inputs, labels in self.train_loader:
-            
+
             # break if past training limit
             if i >= train_limit:
                 break
@@ -444,7 +1126,7 @@ class NetManager():
             # run net forward, tracking history
             with torch.set_grad_enabled(True), torch.autograd.set_detect_anomaly(True):
                 
-                outputs = self.net(inputs)
+                outputs = self.run_net(inputs)
 
                 _, preds = torch.max(outputs, 1)
                 loss = criterion(outputs, labels)
@@ -484,6 +1166,15 @@ class NetManager():
         best_net_state = copy.deepcopy(self.net.state_dict())
         best_acc = 0.0
         best_epoch = -1
+
+        self.perf_log = self.get_perf_log()
+        if self.act_stats is not None:
+            act_stats_log = self.act_stats.get_log(self.net_dir, 
+                self.perf_log.metadata)
+        if self.grad_stats is not None:
+            grad_stats_log = self.grad_stats.get_log(self.net_dir, 
+                self.perf_log.metadata)
+        epoch_size = len(self.train_set) * min(train_frac, 1.)
     
         if self.epoch == 0:
             # validate initial state for science
@@ -493,6 +1184,7 @@ class NetManager():
             # track accuracy and loss
             self.perf_stats.extend([] for i in range(n_epochs + 1))
             self.perf_stats[self.epoch] = [val_acc, val_loss, None, None]
+            self.log_perf_stats(self.epoch, val_acc, val_loss)
         else:
             # on resume, the current state will have already been eval'd
             self.perf_stats.extend([] for i in range(n_epochs))
@@ -501,18 +1193,26 @@ class NetManager():
         for epoch in epochs:
             print('Epoch {}/{}'.format(epoch, self.epoch + n_epochs))
             print('-' * 10)
+            epoch_start = time.time()
     
             # training phase
             (train_acc, train_loss) = self.train_net(criterion, optimizer, scheduler, train_frac)
-            
+            train_time = time.time() - epoch_start
+            if self.act_stats is not None:
+                self.act_stats.flush(epoch, act_stats_log)
+            if self.grad_stats is not None:
+                self.grad_stats.flush(epoch, grad_stats_log)
+
             # validation phase
             (val_acc, val_loss) = self.evaluate_net(criterion)
     
             # save a snapshot of net state
             self.save_net_snapshot(epoch, val_acc)
-            
+
             # track stats
             self.perf_stats[epoch] = [val_acc, val_loss, train_acc, train_loss]
+            self.log_perf_stats(epoch, val_acc, val_loss, train_acc, train_loss,
+                time.time() - epoch_start, epoch_size / train_time)
     
             # copy net if best yet
             if val_acc > best_acc:
@@ -527,6 +1227,13 @@ class NetManager():
             time_elapsed // 60, time_elapsed % 60))
         print('Best val Acc: {:.8f} on epoch {}'.format(best_acc, best_epoch))
         
+        if self.act_stats is not None:
+            self.act_stats.close()
+            self.act_stats = None
+        if self.grad_stats is not None:
+            self.grad_stats.close()
+            self.grad_stats = None
+
         # load best net state from training and save it to disk
         self.load_net_state(self.case_id, self.sample, best_epoch, best_net_state)
         self.save_net_snapshot(best_epoch, best_acc)
@@ -534,6 +1241,82 @@ class NetManager():
         # save perf stats
         self.save_arr("perf_stats", np.array(self.perf_stats))
 
+    def get_perf_log(self):
+        """
+        Opens (or prepares) the current net's append-only perf log
+        """
+        metadata = {
+            "net_name": self.net_name,
+            "dataset": self.dataset,
+            "train_scheme": self.train_scheme,
+            "case": self.case_id,
+            "sample": self.sample,
+            "modified_layers": self.modified_layers
+        }
+        filepath = os.path.join(self.net_dir, perf_log_name)
+
+        return MetricsLog(filepath, perf_log_fields, metadata)
+
+    def track_act_stats(self, sample_rate=0.1, **kwargs):
+        """
+        Accumulates per cell type activation stats for a sample_rate 
+        fraction of training batches, appended to the run's act_stats log 
+        every epoch. kwargs go to ActivationStats.
+        """
+        self.act_stats = ActivationStats(self.net, sample_rate, **kwargs)
+
+    def track_grad_stats(self):
+        """
+        Accumulates per cell type gradient norms of the weights feeding each
+        MixedActivationLayer, appended to the run's grad_stats log every 
+        epoch
+        """
+        self.grad_stats = GradientStats(self.net)
+
+    def log_perf_stats(self, epoch, val_acc, val_loss, train_acc=None, 
+        train_loss=None, wall_time=None, throughput=None):
+        """
+        Appends one epoch's metrics to the perf log, so partially trained
+        nets can be analyzed before perf_stats.npy is written
+        """
+        self.perf_log.append({
+            "epoch": epoch,
+            "val_acc": val_acc,
+            "val_loss": val_loss,
+            "train_acc": train_acc,
+            "train_loss": train_loss,
+            "wall_time": wall_time,
+            "throughput": throughput
+        })
+
+        # index from what was just written rather than re-reading the log
+        metadata = dict(self.perf_log.metadata)
+        metadata.update({ "case_id": self.case_id, "epoch": epoch, 
+            "val_acc": val_acc })
+        self.snapshot_index.add_file(self.perf_log.filepath, metadata)
+
+    def load_perf_stats(self):
+        """
+        Loads perf stats for the current net up to the current epoch, from
+        the perf log if there is one or perf_stats.npy otherwise
+        """
+        log_filepath = os.path.join(self.net_dir, perf_log_name)
+        if os.path.exists(log_filepath):
+            df = read_perf_log(log_filepath)
+            df = df[df["epoch"] <= self.epoch]
+
+            self.perf_stats = [[] for i in range(self.epoch + 1)]
+            for row in df.itertuples():
+                train_acc = None if np.isnan(row.train_acc) else row.train_acc
+                train_loss = None if np.isnan(row.train_loss) else row.train_loss
+                self.perf_stats[row.epoch] = [row.val_acc, row.val_loss, 
+                    train_acc, train_loss]
+            return
+
+        stats_filepath = os.path.join(self.net_dir, "perf_stats.npy")
+        perf_stats = np.load(stats_filepath, allow_pickle=True).item().get("perf_stats")
+        self.perf_stats = perf_stats.tolist()
+
 
 
 if __name__=="__main__":
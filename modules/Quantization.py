@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Int8 inference for evaluation on CPU. Linear layers are quantized 
+dynamically, and convs can optionally be quantized statically with 
+calibration on a fixed slice of the training set, held out from the images
+being scored. Each quantized conv quantizes its input and dequantizes its 
+output, so MixedActivationLayers (and anything else between convs) keep 
+running in float.
+"""
+import torch
+import torch.nn as nn
+import copy
+
+try:
+    import torch.ao.quantization as quantization
+except ImportError:
+    import torch.quantization as quantization
+
+class QuantizedConv(nn.Module):
+    """
+    Wraps a conv in quant/dequant stubs for eager mode static quantization
+    """
+
+    def __init__(self, conv):
+
+        super(QuantizedConv, self).__init__()
+        
+        self.quant = quantization.QuantStub()
+        self.conv = conv
+        self.dequant = quantization.DeQuantStub()
+
+    def forward(self, x):
+
+        return self.dequant(self.conv(self.quant(x)))
+
+def wrap_convs(module):
+    """
+    Recursively wraps every Conv2d in module with QuantizedConv. The conv
+    moves to e.g. features.0.conv and features.0 becomes the wrapper, so 
+    hooks resolved by name (NetManager.get_module_name) attach to the 
+    wrapper, whose input and output are float like the original conv's.
+    """
+    for name, child in module._modules.items():
+        
+        if isinstance(child, nn.Conv2d):
+            module._modules[name] = QuantizedConv(child)
+        elif len(list(child.children())) > 0:
+            wrap_convs(child)
+
+    return module
+
+def get_engine():
+    """
+    Picks the best quantized backend available on this machine
+    """
+    engines = torch.backends.quantized.supported_engines
+    for engine in ["x86", "fbgemm", "qnnpack"]:
+        if engine in engines:
+            return engine
+
+    return torch.backends.quantized.engine
+
+def get_calibration_batches(dataset, n_samples=256, batch_size=32):
+    """
+    Decodes a fixed slice of dataset once, e.g. the first n_samples of the 
+    training set, into batches (inputs, labels) every net of a run can be
+    calibrated on
+    """
+    subset = torch.utils.data.Subset(dataset, range(min(n_samples, len(dataset))))
+    loader = torch.utils.data.DataLoader(subset, batch_size=batch_size, 
+        shuffle=False)
+
+    return [(inputs, labels) for inputs, labels in loader]
+
+def quantize_net(net, calibration_batches=None, static_convs=False):
+    """
+    Returns an int8 copy of net for CPU inference.
+
+    Args:
+        net
+        calibration_batches: Batches (inputs, labels) to calibrate conv 
+            activation ranges on, required if static_convs. See 
+            get_calibration_batches.
+        static_convs (bool): Also quantize convs statically.
+    """
+    torch.backends.quantized.engine = get_engine()
+    qnet = copy.deepcopy(net).cpu().eval()
+
+    if static_convs:
+        if calibration_batches is None:
+            raise ValueError("Static conv quantization needs calibration batches")
+
+        wrap_convs(qnet)
+        qconfig = quantization.get_default_qconfig(torch.backends.quantized.engine)
+        for module in qnet.modules():
+            if isinstance(module, QuantizedConv):
+                module.qconfig = qconfig
+
+        quantization.prepare(qnet, inplace=True)
+        
+        # observe activation ranges
+        with torch.no_grad():
+            for inputs, labels in calibration_batches:
+                qnet(inputs.cpu())
+        
+        quantization.convert(qnet, inplace=True)
+
+    return quantization.quantize_dynamic(qnet, {nn.Linear}, dtype=torch.qint8)
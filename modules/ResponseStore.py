@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streams layer responses to disk as they're captured. Each batch is 
+detached, optionally reduced and downcast, moved off the device and written 
+into a preallocated memory-mapped .npy file, so memory use doesn't grow 
+with the size of the dataset. Responses can also be stored in a quantized,
+chunk-compressed .rsp format with an index for partial reads.
+"""
+import torch
+import numpy as np
+import os
+import json
+import struct
+import zlib
+
+def spatial_mean(tensor):
+    """
+    Averages responses over any spatial dims, (N, C, H, W) -> (N, C)
+    """
+    if tensor.dim() <= 2:
+        return tensor
+
+    return tensor.mean(dim=tuple(range(2, tensor.dim())))
+
+def channel_subsample(step, offset=0):
+    """
+    Keeps every step-th channel, starting at offset
+    """
+    def reducer(tensor):
+        return tensor[:, offset::step]
+
+    return reducer
+
+def compose(*reducers):
+    """
+    Chains reducers, applied left to right
+    """
+    def reducer(tensor):
+        for r in reducers:
+            tensor = r(tensor)
+        return tensor
+
+    return reducer
+
+class ResponseWriter():
+    """
+    Writes batches of responses into a memory-mapped .npy file with room
+    for n_samples rows. The file is allocated on the first batch, once the 
+    response shape is known, and only appears at filepath once closed.
+    """
+
+    def __init__(self, filepath, n_samples, reducer=None, dtype=np.float32):
+
+        self.filepath = filepath
+        self.tmp_path = filepath + ".tmp"
+        self.n_samples = n_samples
+        self.reducer = reducer
+        self.dtype = dtype
+        self.responses = None
+        self.i = 0
+
+    def write(self, tensor):
+
+        with torch.no_grad():
+            tensor = tensor.detach()
+            if self.reducer is not None:
+                tensor = self.reducer(tensor)
+            arr = tensor.cpu().numpy()
+
+        # allocate once the response size is known
+        if self.responses is None:
+            self.responses = np.lib.format.open_memmap(self.tmp_path, mode="w+",
+                dtype=self.dtype, shape=(self.n_samples,) + arr.shape[1:])
+
+        n = len(arr)
+        if self.i + n > self.n_samples:
+            raise ValueError(f"More than {self.n_samples} responses written "
+                + f"to {self.filepath}")
+
+        self.responses[self.i:self.i + n] = arr
+        self.i += n
+
+    def close(self, chunk_size=4096):
+        """
+        Flushes and moves the responses into place, trimming unused rows
+        """
+        if self.responses is None:
+            return None
+
+        self.responses.flush()
+
+        if self.i < self.n_samples:
+            # copy the rows written, a chunk at a time
+            trimmed = np.lib.format.open_memmap(self.tmp_path + ".trim", 
+                mode="w+", dtype=self.dtype, 
+                shape=(self.i,) + self.responses.shape[1:])
+            for start in range(0, self.i, chunk_size):
+                stop = min(start + chunk_size, self.i)
+                trimmed[start:stop] = self.responses[start:stop]
+            trimmed.flush()
+            del trimmed
+            del self.responses
+            os.replace(self.tmp_path + ".trim", self.tmp_path)
+        else:
+            del self.responses
+
+        self.responses = None
+        os.replace(self.tmp_path, self.filepath)
+
+        return self.filepath
+
+# compressed response format
+rsp_magic = b"RSP1"
+rsp_ext = ".rsp"
+
+def quantize(arr, mode):
+    """
+    Quantizes a block of responses (n_stimuli, n_channels, ...). int8 is
+    symmetric per channel, with scales taken over the block.
+
+    Returns:
+        (data, scales): scales is None unless mode is int8.
+    """
+    if mode == "int8":
+        reduce_axes = (0,) + tuple(range(2, arr.ndim))
+        scales = np.abs(arr).max(axis=reduce_axes).astype(np.float32) / 127.
+        scales[scales == 0] = 1.
+        shape = [1, -1] + [1] * (arr.ndim - 2)
+        data = np.round(arr / scales.reshape(shape)).astype(np.int8)
+        return data, scales
+
+    if mode == "fp16":
+        return arr.astype(np.float16), None
+
+    return arr.astype(np.float32), None
+
+def dequantize(data, scales):
+
+    if scales is None:
+        return data.astype(np.float32)
+
+    shape = [1, -1] + [1] * (data.ndim - 2)
+    return data.astype(np.float32) * scales.reshape(shape)
+
+class CompressedResponseWriter():
+    """
+    Streams responses into a compressed, chunked .rsp file. Stimuli are
+    buffered until a chunk is full, then split into blocks of 
+    channel_chunk channels, each quantized and zlib-compressed on its own. 
+    A JSON index of the blocks goes at the end of the file, so any range of
+    stimuli and channels can be read back by decompressing only the 
+    blocks it overlaps.
+
+    Args:
+        filepath (str)
+        mode (str): "int8", "fp16" or "fp32".
+        stimulus_chunk (int): Stimuli per block.
+        channel_chunk (int): Channels per block.
+        level (int): zlib compression level.
+    """
+
+    def __init__(self, filepath, mode="int8", stimulus_chunk=256, 
+        channel_chunk=64, level=6):
+
+        self.filepath = filepath
+        self.tmp_path = filepath + ".tmp"
+        self.mode = mode
+        self.stimulus_chunk = stimulus_chunk
+        self.channel_chunk = channel_chunk
+        self.level = level
+        self.file = None
+        self.buffer = []
+        self.n_buffered = 0
+        self.n_stimuli = 0
+        self.item_shape = None
+        self.blocks = []
+
+    def write(self, tensor):
+
+        with torch.no_grad():
+            arr = tensor.detach().float().cpu().numpy()
+
+        if self.file is None:
+            self.file = open(self.tmp_path, "wb")
+            self.file.write(rsp_magic)
+            self.item_shape = list(arr.shape[1:])
+
+        self.buffer.append(arr)
+        self.n_buffered += len(arr)
+
+        while self.n_buffered >= self.stimulus_chunk:
+            self.write_chunk(self.stimulus_chunk)
+
+    def write_chunk(self, n):
+        """
+        Writes the first n buffered stimuli as one row of blocks
+        """
+        arr = np.concatenate(self.buffer)
+        chunk, rest = arr[:n], arr[n:]
+        self.buffer = [rest] if len(rest) > 0 else []
+        self.n_buffered = len(rest)
+
+        n_channels = chunk.shape[1] if chunk.ndim > 1 else 1
+        if chunk.ndim == 1:
+            chunk = chunk[:,None]
+
+        for c_start in range(0, n_channels, self.channel_chunk):
+            c_stop = min(c_start + self.channel_chunk, n_channels)
+            data, scales = quantize(np.ascontiguousarray(chunk[:,c_start:c_stop]), 
+                self.mode)
+            
+            payload = data.tobytes()
+            if scales is not None:
+                payload = scales.tobytes() + payload
+            payload = zlib.compress(payload, self.level)
+
+            self.blocks.append([self.n_stimuli, self.n_stimuli + len(chunk), 
+                c_start, c_stop, self.file.tell(), len(payload)])
+            self.file.write(payload)
+
+        self.n_stimuli += len(chunk)
+
+    def close(self):
+        """
+        Writes any remaining stimuli and the index, and moves the file 
+        into place
+        """
+        if self.file is None:
+            return None
+
+        if self.n_buffered > 0:
+            self.write_chunk(self.n_buffered)
+
+        index = json.dumps({
+            "shape": [self.n_stimuli] + self.item_shape,
+            "mode": self.mode,
+            "blocks": self.blocks
+        }).encode("utf-8")
+        index_offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(struct.pack("<Q", index_offset))
+        self.file.close()
+        self.file = None
+
+        os.replace(self.tmp_path, self.filepath)
+        return self.filepath
+
+class CompressedResponseReader():
+    """
+    Reads .rsp files written by CompressedResponseWriter. Only the index is
+    read up front; blocks are decompressed and dequantized on demand.
+    """
+
+    def __init__(self, filepath):
+
+        self.filepath = filepath
+        
+        with open(filepath, "rb") as f:
+            if f.read(4) != rsp_magic:
+                raise ValueError(f"{filepath} is not a compressed response file")
+            f.seek(-8, os.SEEK_END)
+            index_end = f.tell()
+            index_offset = struct.unpack("<Q", f.read(8))[0]
+            f.seek(index_offset)
+            index = json.loads(f.read(index_end - index_offset).decode("utf-8"))
+
+        self.shape = tuple(index["shape"])
+        self.mode = index["mode"]
+        self.blocks = index["blocks"]
+        self.dtype = { "int8": np.int8, "fp16": np.float16 }.get(self.mode, np.float32)
+
+    def __len__(self):
+
+        return self.shape[0]
+
+    def read_block(self, f, block):
+
+        s_start, s_stop, c_start, c_stop, offset, length = block
+        f.seek(offset)
+        payload = zlib.decompress(f.read(length))
+        
+        n_channels = c_stop - c_start
+        scales = None
+        if self.mode == "int8":
+            scales = np.frombuffer(payload[:4 * n_channels], dtype=np.float32)
+            payload = payload[4 * n_channels:]
+        
+        block_shape = (s_stop - s_start, n_channels) + self.shape[2:]
+        data = np.frombuffer(payload, dtype=self.dtype).reshape(block_shape)
+        
+        return dequantize(data, scales)
+
+    def read(self, stimuli=None, channels=None):
+        """
+        Returns the dequantized responses for a range of stimuli and 
+        channels as a float tensor, decompressing only the blocks needed.
+
+        Args:
+            stimuli (tuple): (start, stop), all stimuli if None. Clamped
+                to the stored range like a slice.
+            channels (tuple): (start, stop), all channels if None.
+        """
+        n_channels = self.shape[1] if len(self.shape) > 1 else 1
+        (s_start, s_stop) = stimuli if stimuli is not None else (0, self.shape[0])
+        (c_start, c_stop) = channels if channels is not None else (0, n_channels)
+
+        # clamp to what's stored, as numpy slicing would
+        s_start, s_stop, _ = slice(s_start, s_stop).indices(self.shape[0])
+        c_start, c_stop, _ = slice(c_start, c_stop).indices(n_channels)
+        s_stop, c_stop = max(s_start, s_stop), max(c_start, c_stop)
+        
+        out = np.empty((s_stop - s_start, c_stop - c_start) + self.shape[2:], 
+            dtype=np.float32)
+
+        with open(self.filepath, "rb") as f:
+            for block in self.blocks:
+                b_s0, b_s1, b_c0, b_c1 = block[:4]
+                if b_s1 <= s_start or b_s0 >= s_stop or b_c1 <= c_start or b_c0 >= c_stop:
+                    continue
+
+                data = self.read_block(f, block)
+                s0, s1 = max(b_s0, s_start), min(b_s1, s_stop)
+                c0, c1 = max(b_c0, c_start), min(b_c1, c_stop)
+                out[s0 - s_start:s1 - s_start, c0 - c_start:c1 - c_start] = \
+                    data[s0 - b_s0:s1 - b_s0, c0 - b_c0:c1 - b_c0]
+
+        if len(self.shape) == 1:
+            out = out[:,0]
+
+        return torch.from_numpy(out)
+
+    def iter_chunks(self, batch_size=256):
+        """
+        Yields (start, responses) for consecutive ranges of stimuli
+        """
+        for start in range(0, self.shape[0], batch_size):
+            stop = min(start + batch_size, self.shape[0])
+            yield start, self.read((start, stop))
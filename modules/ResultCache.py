@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process memoization of StatsProcessor results, so a batch of figures 
+loads each artifact at most once. Entries are keyed by the call and a data
+version stamp, and evicted least recently used first once the cache holds 
+more than max_bytes.
+"""
+import numpy as np
+import pandas as pd
+import copy
+import sys
+import functools
+from collections import OrderedDict
+
+def get_size(obj):
+    """
+    Estimates the memory held by a result, in bytes
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(get_size(o) for o in obj)
+
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(get_size(k) + get_size(v) 
+            for k, v in obj.items())
+
+    return sys.getsizeof(obj)
+
+def copy_result(obj):
+    """
+    Copies a result so callers can't modify the cached one in place (plots
+    routinely set_index(inplace=True) on what they're given)
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return obj.copy()
+
+    if isinstance(obj, tuple):
+        return tuple(copy_result(o) for o in obj)
+
+    if isinstance(obj, list):
+        return [copy_result(o) for o in obj]
+
+    return copy.deepcopy(obj)
+
+class ResultCache():
+    """
+    LRU cache bounded by the estimated memory size of its entries
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns (True, result) on a hit and (False, None) on a miss
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return (False, None)
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return (True, copy_result(self.entries[key][0]))
+
+    def put(self, key, result):
+
+        if key in self.entries:
+            self.n_bytes -= self.entries.pop(key)[1]
+
+        size = get_size(result)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (copy_result(result), size)
+        self.n_bytes += size
+
+        # evict least recently used
+        while self.n_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.n_bytes -= evicted_size
+
+    def clear(self):
+
+        self.entries.clear()
+        self.n_bytes = 0
+
+def memoize(method):
+    """
+    Memoizes a StatsProcessor method on its arguments and the processor's
+    current data version, so results go stale as soon as the index changes
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+
+        key = (method.__name__, repr(args), repr(sorted(kwargs.items())),
+            self.get_data_version())
+        (hit, result) = self.cache.get(key)
+        if hit:
+            return result
+
+        result = method(self, *args, **kwargs)
+        self.cache.put(key, result)
+        return result
+
+    return wrapper
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Segment reductions of weight (or activation) statistics by channel group,
+e.g. cell type. Power sums are accumulated for every group in one index_add,
+and means, SEMs and higher moments are derived from those accumulators.
+"""
+import torch
+import numpy as np
+
+# accumulators kept per group, the higher moments only on request
+acc_names = ["count", "sum", "sq_sum", "abs_sum"]
+higher_acc_names = ["cube_sum", "quad_sum"]
+
+# elements per chunk when a reduction needs a temporary
+chunk_elements = 2**22
+
+def get_group_ids(n_features, n_fns, n_repeat):
+    """
+    Channel group-id vector equivalent to generate_masks: channel i 
+    belongs to group floor(i / n_repeat) % n_fns
+    """
+    return (torch.arange(n_features) // n_repeat) % n_fns
+
+def channel_sums(tensor, channel_dim=0, higher_moments=False):
+    """
+    Reduces everything after channel_dim, returning float64 power sums of 
+    shape (batch, n_channels) where batch flattens any dims before 
+    channel_dim, plus the number of elements per channel. Channels are 
+    reduced in the tensor's own dtype (at least float32) without full-size
+    temporaries; cube_sum and quad_sum (for skew and kurtosis) are only
+    computed if higher_moments, a chunk of channels at a time.
+    """
+    x = tensor.detach()
+    if x.dtype in [torch.float16, torch.bfloat16]:
+        x = x.float()
+    n_channels = x.shape[channel_dim]
+    x = x.reshape(-1, n_channels, int(np.prod(x.shape[channel_dim + 1:])))
+
+    norm = torch.linalg.vector_norm
+    sums = {
+        "sum": x.sum(-1).double(),
+        "sq_sum": norm(x, 2, dim=-1).double() ** 2,
+        "abs_sum": norm(x, 1, dim=-1).double()
+    }
+
+    # these cancel heavily in the central moments, so chunks go to float64
+    if higher_moments:
+        per_chunk = max(chunk_elements // max(x.shape[0] * x.shape[2], 1), 1)
+        cube_sums = []
+        quad_sums = []
+        for start in range(0, n_channels, per_chunk):
+            chunk = x[:, start:start + per_chunk].double()
+            chunk_sq = chunk * chunk
+            cube_sums.append((chunk_sq * chunk).sum(-1))
+            quad_sums.append((chunk_sq * chunk_sq).sum(-1))
+        sums["cube_sum"] = torch.cat(cube_sums, dim=1)
+        sums["quad_sum"] = torch.cat(quad_sums, dim=1)
+
+    return sums, x.shape[-1]
+
+def segment_accumulate(tensors, group_ids, n_groups, channel_dim=0, 
+    higher_moments=False):
+    """
+    Accumulates per-group power sums for one or more layers in a single 
+    scatter. Only the small per channel sums are kept in float64.
+
+    Args:
+        tensors: A tensor, or list of tensors (one per layer), shaped 
+            (*batch, channels, *rest). Stacked snapshots go in the batch 
+            dims, which must match across layers.
+        group_ids: Channel group-id vector (or list of them, one per layer).
+        n_groups (int): Number of groups per layer.
+        channel_dim (int): Position of the channel dim.
+        higher_moments (bool): Also accumulate cube_sum and quad_sum, as
+            needed by acc_skew and acc_kurtosis.
+
+    Returns:
+        acc (dict): Accumulators shaped (batch, n_layers, n_groups), or 
+            (batch, n_groups) when a single tensor was given.
+    """
+    single = torch.is_tensor(tensors)
+    if single:
+        tensors, group_ids = [tensors], [group_ids]
+
+    batch_shape = tensors[0].shape[:channel_dim]
+    names = acc_names + (higher_acc_names if higher_moments else [])
+    per_channel = { name: [] for name in names }
+    offset_ids = []
+
+    for i_layer, (tensor, ids) in enumerate(zip(tensors, group_ids)):
+        
+        sums, n_per_channel = channel_sums(tensor, channel_dim, higher_moments)
+        batch = sums["sum"].shape[0]
+        for name, vals in sums.items():
+            per_channel[name].append(vals)
+
+        per_channel["count"].append(torch.full_like(sums["sum"], n_per_channel))
+        offset_ids.append(ids.to(sums["sum"].device) + i_layer * n_groups)
+
+    # one scatter over every layer's channels
+    offset_ids = torch.cat(offset_ids)
+    n_segments = len(tensors) * n_groups
+    acc = dict()
+
+    for name, vals in per_channel.items():
+        vals = torch.cat(vals, dim=1)
+        out = torch.zeros(batch, n_segments, dtype=vals.dtype, device=vals.device)
+        out.index_add_(1, offset_ids, vals)
+        out = out.reshape(*batch_shape, len(tensors), n_groups)
+        acc[name] = out[..., 0, :] if single else out
+
+    return acc
+
+def other_dims(tensor, channel_dim=1):
+    """
+    Every dim of tensor but channel_dim, for reducing per channel
+    """
+    return [d for d in range(tensor.dim()) if d != channel_dim % tensor.dim()]
+
+def group_channels(per_channel, group_ids, n_groups):
+    """
+    Sums per channel values into their groups in float64
+    """
+    out = torch.zeros(n_groups, dtype=torch.float64, device=per_channel.device)
+
+    return out.index_add_(0, group_ids, per_channel.double())
+
+def segment_sum(tensor, group_ids, n_groups, channel_dim=1):
+    """
+    Sums every element of tensor into its channel's group, e.g. a batch of
+    activations (N, C, H, W) into (n_groups,), without leaving the device.
+    Channels are reduced in place in tensor's dtype (bools are counted), 
+    only the per channel sums are upcast.
+    """
+    dtype = torch.float32 if tensor.dtype in [torch.float16, torch.bfloat16] else None
+    per_channel = tensor.sum(dim=other_dims(tensor, channel_dim), dtype=dtype)
+
+    return group_channels(per_channel, group_ids, n_groups)
+
+def merge(acc, dim):
+    """
+    Combines accumulators across dim, e.g. groups into a layer total
+    """
+    return { name: vals.sum(dim) for name, vals in acc.items() }
+
+def acc_mean(acc):
+
+    return acc["sum"] / acc["count"]
+
+def acc_abs_mean(acc):
+
+    return acc["abs_sum"] / acc["count"]
+
+def acc_var(acc):
+    """
+    Unbiased variance of the values
+    """
+    n = acc["count"]
+    return (acc["sq_sum"] - acc["sum"] ** 2 / n) / (n - 1)
+
+def acc_abs_sem(acc):
+    """
+    Standard error of the mean absolute value, i.e. 
+    torch.std(abs(x)) / sqrt(n)
+    """
+    n = acc["count"]
+    abs_var = (acc["sq_sum"] - acc["abs_sum"] ** 2 / n) / (n - 1)
+    return torch.sqrt(torch.clamp(abs_var, min=0)) / torch.sqrt(n)
+
+def central_moments(acc):
+    """
+    Second, third and fourth (biased) central moments from raw power sums
+    """
+    n = acc["count"]
+    mean = acc["sum"] / n
+    ex2 = acc["sq_sum"] / n
+    ex3 = acc["cube_sum"] / n
+    ex4 = acc["quad_sum"] / n
+
+    m2 = ex2 - mean ** 2
+    m3 = ex3 - 3 * mean * ex2 + 2 * mean ** 3
+    m4 = ex4 - 4 * mean * ex3 + 6 * mean ** 2 * ex2 - 3 * mean ** 4
+
+    return m2, m3, m4
+
+def acc_skew(acc):
+
+    m2, m3, _ = central_moments(acc)
+    return m3 / m2 ** 1.5
+
+def acc_kurtosis(acc):
+    """
+    Excess kurtosis
+    """
+    m2, _, m4 = central_moments(acc)
+    return m4 / m2 ** 2 - 3
+
+def acc_to_lists(acc):
+    """
+    Converts accumulators to plain lists, e.g. for JSON
+    """
+    return { name: vals.tolist() for name, vals in acc.items() }
+
+def acc_from_lists(acc):
+
+    return { name: torch.tensor(vals, dtype=torch.float64) for name, vals in acc.items() }
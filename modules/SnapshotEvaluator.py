@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-evaluates many snapshots against the validation set at once. Each batch
+is decoded once and run through a chunk of loaded nets, rather than every
+snapshot reloading the dataset in its own NetManager.
+"""
+import torch
+import torch.nn as nn
+import numpy as np
+import pandas as pd
+import os
+import shutil
+
+try:
+    from .SnapshotIO import load_snapshot
+except:
+    from SnapshotIO import load_snapshot
+
+try:
+    from .Quantization import quantize_net
+except:
+    from Quantization import quantize_net
+
+try:
+    from .HookRegistry import HookRegistry
+except:
+    from HookRegistry import HookRegistry
+
+try:
+    from .util import get_net_tag, ensure_sub_dir, FeatureCacheDataset
+except:
+    from util import get_net_tag, ensure_sub_dir, FeatureCacheDataset
+
+class SnapshotEvaluator():
+    """
+    Evaluates a list of snapshots, chunk_size nets at a time.
+
+    Args:
+        manager (NetManager): Builds the nets and provides the (already 
+            loaded) validation set.
+        snapshot_paths (list)
+        chunk_size (int): Nets held in memory at once.
+        cache_inputs (bool): With more than one chunk, decode the validation
+            set once into a memory-mapped cache shared by every chunk.
+        quantize (str): None, "dynamic" (int8 Linear layers) or "static" 
+            (also int8 convs, calibrated once per run on a slice of the 
+            training set). Quantized nets are evaluated on CPU, and static 
+            ones record responses at the float wrappers around their convs
+            (see wrap_convs).
+    """
+
+    def __init__(self, manager, snapshot_paths, chunk_size=8, cache_inputs=True,
+        quantize=None):
+
+        if quantize not in [None, "dynamic", "static"]:
+            raise ValueError(f"Unknown quantization mode: {quantize}")
+        if quantize == "static" and manager.cached_features:
+            raise ValueError("Static conv quantization needs raw inputs, not cached features")
+
+        self.manager = manager
+        self.snapshot_paths = snapshot_paths
+        self.chunk_size = chunk_size
+        self.cache_inputs = cache_inputs
+        self.quantize = quantize
+        if quantize is not None:
+            manager.device = torch.device("cpu")
+
+    def load_net(self, snapshot_path):
+        """
+        Builds the net for a snapshot, leaving the manager set up for it
+        """
+        snapshot = load_snapshot(snapshot_path)
+        
+        if snapshot.get("train_scheme") is not None:
+            self.manager.train_scheme = snapshot.get("train_scheme")
+        self.manager.case_id = snapshot.get("case")
+        self.manager.sample = snapshot.get("sample")
+        self.manager.epoch = snapshot.get("epoch")
+        self.manager.modified_layers = snapshot.get("modified_layers")
+        net = self.manager.materialize_net(snapshot["state_dict"])
+        if self.quantize is not None:
+            static = self.quantize == "static"
+            calibration_batches = self.manager.get_calibration_batches() if static else None
+            net = quantize_net(net, calibration_batches, static)
+
+        metadata = {
+            "path": snapshot_path,
+            "train_scheme": snapshot.get("train_scheme"),
+            "case": snapshot.get("case"),
+            "sample": snapshot.get("sample"),
+            "epoch": snapshot.get("epoch")
+        }
+
+        return metadata, net
+
+    def set_response_hooks(self, net, layer_names, reducers, dtype):
+        """
+        Streams the given layers' responses for the manager's current 
+        snapshot, as NetManager.set_response_hooks does
+        """
+        mgr = self.manager
+        mgr.net = net
+        registry = HookRegistry(net)
+        resp_dir = mgr.get_responses_dir()
+        net_tag = get_net_tag(mgr.net_name, mgr.case_id, mgr.sample, mgr.epoch)
+        
+        for layer_name in layer_names:
+            reducer = reducers.get(layer_name) if isinstance(reducers, dict) else reducers
+            filepath = os.path.join(resp_dir, f"output_{net_tag}_{layer_name}.npy")
+            registry.add_writer(mgr.get_module_name(layer_name), filepath, 
+                len(mgr.val_set), "output", reducer, dtype, key=layer_name)
+
+        return registry
+
+    def get_loader(self):
+        """
+        The validation loader, or one over a decoded cache of it
+        """
+        mgr = self.manager
+        n_chunks = int(np.ceil(len(self.snapshot_paths) / self.chunk_size))
+        if not self.cache_inputs or n_chunks <= 1 or mgr.cached_features:
+            return mgr.val_loader, None
+
+        cache_dir = ensure_sub_dir(mgr.data_dir, f"eval_cache/{os.getpid()}/")
+        inputs_path = os.path.join(cache_dir, "val_features.npy")
+        labels_path = os.path.join(cache_dir, "val_labels.npy")
+        print(f"Decoding validation set to {cache_dir}")
+
+        n_samples = len(mgr.val_set)
+        inputs_arr = None
+        labels = np.empty(n_samples, dtype=np.int64)
+        i = 0
+
+        for inputs, batch_labels in mgr.val_loader:
+            if inputs_arr is None:
+                inputs_arr = np.lib.format.open_memmap(inputs_path, mode="w+",
+                    dtype=np.float32, shape=(n_samples,) + tuple(inputs.shape[1:]))
+            
+            n = len(inputs)
+            inputs_arr[i:i + n] = inputs.numpy()
+            labels[i:i + n] = batch_labels.numpy()
+            i += n
+
+        inputs_arr.flush()
+        del inputs_arr
+        np.save(labels_path, labels)
+
+        loader = torch.utils.data.DataLoader(
+            FeatureCacheDataset(inputs_path, labels_path), 
+            batch_size=mgr.val_loader.batch_size, shuffle=False, num_workers=0)
+
+        return loader, cache_dir
+
+    def evaluate(self, n_classes=None, layer_names=None, reducers=None, 
+        dtype=np.float32):
+        """
+        Scores every snapshot, optionally streaming responses of the given 
+        layers to disk along the way.
+
+        Args:
+            n_classes (int): Defaults to the manager's.
+            layer_names (list): layers_of_interest or module names to 
+                record responses for, none if None.
+            reducers: Optional fn, or dict of layer name to fn, applied to
+                each batch of responses.
+
+        Returns:
+            metrics_df (dataframe): One row per snapshot with val_acc, 
+                val_loss and the accuracy on each class (acc_class_N).
+        """
+        mgr = self.manager
+        n_classes = n_classes if n_classes is not None else mgr.n_classes
+        criterion = nn.CrossEntropyLoss(reduction="sum")
+        loader, cache_dir = self.get_loader()
+        rows = []
+
+        try:
+            for start in range(0, len(self.snapshot_paths), self.chunk_size):
+
+                chunk_paths = self.snapshot_paths[start:start + self.chunk_size]
+                print(f"Evaluating snapshots {start + 1}-{start + len(chunk_paths)} "
+                    + f"of {len(self.snapshot_paths)}")
+                
+                chunk = []
+                for snapshot_path in chunk_paths:
+                    metadata, net = self.load_net(snapshot_path)
+                    registry = None
+                    if layer_names is not None:
+                        registry = self.set_response_hooks(net, layer_names, 
+                            reducers, dtype)
+                    chunk.append((metadata, net, registry))
+
+                losses = torch.zeros(len(chunk), dtype=torch.float64)
+                corrects = torch.zeros(len(chunk), n_classes, dtype=torch.float64)
+                class_counts = torch.zeros(n_classes, dtype=torch.float64)
+
+                # each batch is decoded once for the whole chunk
+                with torch.no_grad():
+                    for inputs, labels in loader:
+                        inputs = inputs.to(mgr.device)
+                        labels = labels.to(mgr.device)
+                        class_counts += torch.bincount(labels, 
+                            minlength=n_classes).double().cpu()
+
+                        for k, (metadata, net, registry) in enumerate(chunk):
+                            outputs = self.run_net(net, inputs)
+                            _, preds = torch.max(outputs, 1)
+                            losses[k] += criterion(outputs, labels).item()
+                            corrects[k] += torch.bincount(labels[preds == labels], 
+                                minlength=n_classes).double().cpu()
+
+                n_samples = class_counts.sum()
+                for k, (metadata, net, registry) in enumerate(chunk):
+                    if registry is not None:
+                        registry.close()
+
+                    row = dict(metadata)
+                    row["val_acc"] = (corrects[k].sum() / n_samples).item()
+                    row["val_loss"] = (losses[k] / n_samples).item()
+                    class_acc = corrects[k] / torch.clamp(class_counts, min=1)
+                    for c in range(n_classes):
+                        row[f"acc_class_{c}"] = class_acc[c].item()
+                    rows.append(row)
+
+                del chunk
+
+        finally:
+            if cache_dir is not None:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+
+        return pd.DataFrame(rows)
+
+    def run_net(self, net, inputs):
+        """
+        As NetManager.run_net, for a net other than the manager's current one
+        """
+        if self.manager.cached_features:
+            return net.classifier(inputs)
+
+        return net(inputs)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reading and writing net snapshots.
+
+Snapshots are saved as .snap files: an 8 byte little-endian header length,
+a JSON header holding the snapshot metadata and each tensor's dtype, shape
+and byte offsets, then the raw tensor data. Readers memory-map the file, so
+loading the metadata or a subset of tensors never touches the rest of it.
+Legacy torch-pickled .pt snapshots are still readable.
+"""
+import torch
+import numpy as np
+import os
+import json
+import mmap
+import struct
+
+snapshot_ext = ".snap"
+
+# tensor dtypes that can be stored, by their header names
+dtypes = {
+    "float64": torch.float64,
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "int64": torch.int64,
+    "int32": torch.int32,
+    "int16": torch.int16,
+    "int8": torch.int8,
+    "uint8": torch.uint8,
+    "bool": torch.bool
+}
+dtype_names = { v: k for k, v in dtypes.items() }
+
+# tensor data is aligned to this many bytes
+alignment = 64
+
+def is_legacy_snapshot(filepath):
+
+    return not filepath.endswith(snapshot_ext)
+
+def load_legacy_snapshot(filepath, map_location=None):
+    """
+    Unpickles a legacy snapshot, onto the cpu unless map_location says
+    otherwise (they may have been saved from a gpu)
+    """
+    if map_location is None:
+        map_location = "cpu"
+
+    return torch.load(filepath, map_location=map_location)
+
+def save_snapshot(filepath, metadata, state_dict):
+    """
+    Writes metadata (JSON serializable) and state_dict to filepath
+    """
+    header = { "__metadata__": metadata }
+    tensors = []
+    offset = 0
+
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        if tensor.dtype not in dtype_names:
+            raise ValueError(f"Can't save {name} with dtype {tensor.dtype}")
+        
+        n_bytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": dtype_names[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + n_bytes]
+        }
+        tensors.append(tensor)
+        offset += n_bytes + (-n_bytes % alignment)
+
+    # pad header so data starts aligned
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(8 + len(header_bytes)) % alignment)
+
+    # write to a temp file first so readers never see a partial snapshot
+    tmp_path = filepath + f".{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        
+        for tensor in tensors:
+            data = tensor.numpy().tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % alignment))
+
+    os.replace(tmp_path, filepath)
+
+def read_header(filepath):
+    """
+    Returns the parsed JSON header and the offset tensor data starts at
+    """
+    with open(filepath, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len).decode("utf-8"))
+
+    return header, 8 + header_len
+
+def load_snapshot_metadata(filepath):
+    """
+    Returns the metadata of the snapshot at filepath without loading any 
+    of its tensors (except for legacy snapshots, which must be unpickled)
+    """
+    if is_legacy_snapshot(filepath):
+        snapshot_state = load_legacy_snapshot(filepath)
+        snapshot_state.pop("state_dict", None)
+        return snapshot_state
+
+    header, _ = read_header(filepath)
+    return header["__metadata__"]
+
+def key_matcher(keys):
+    """
+    Returns a predicate on tensor names from a list of names, a predicate
+    or None (match everything)
+    """
+    if callable(keys):
+        return keys
+    
+    if keys is not None:
+        key_set = set(keys)
+        return lambda k: k in key_set
+    
+    return lambda k: True
+
+def load_tensors(filepath, keys=None, map_location=None):
+    """
+    Loads tensors from the snapshot at filepath.
+
+    Args:
+        filepath (str)
+        keys: List of tensor names, a predicate on tensor names, or None 
+            for all tensors.
+        map_location: Optional device to move the tensors to. Legacy 
+            snapshots are loaded onto the cpu by default.
+
+    Returns:
+        state_dict (dict): Tensor names to tensors, in saved order.
+    """
+    match = key_matcher(keys)
+
+    if is_legacy_snapshot(filepath):
+        state_dict = load_legacy_snapshot(filepath, map_location)["state_dict"]
+        return { k: v for k, v in state_dict.items() if match(k) }
+
+    header, data_start = read_header(filepath)
+
+    # copy-on-write map: lazily paged in, and writable as torch expects
+    with open(filepath, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    state_dict = dict()
+    for name, info in header.items():
+
+        if name == "__metadata__" or not match(name):
+            continue
+
+        start, end = info["data_offsets"]
+        dtype = np.dtype(info["dtype"])
+        arr = np.frombuffer(buffer, dtype=dtype, 
+            count=(end - start) // dtype.itemsize, offset=data_start + start)
+        tensor = torch.from_numpy(arr).reshape(info["shape"])
+
+        if map_location is not None:
+            tensor = tensor.to(map_location)
+
+        state_dict[name] = tensor
+
+    return state_dict
+
+def load_snapshot(filepath, keys=None, map_location=None):
+    """
+    Loads a snapshot as a dict of its metadata plus "state_dict", the 
+    same shape legacy snapshots unpickle to. keys restricts which tensors
+    are loaded, as in load_tensors.
+    """
+    if is_legacy_snapshot(filepath):
+        snapshot_state = load_legacy_snapshot(filepath, map_location)
+        match = key_matcher(keys)
+        snapshot_state["state_dict"] = { k: v for k, v in 
+            snapshot_state["state_dict"].items() if match(k) }
+        return snapshot_state
+
+    snapshot_state = load_snapshot_metadata(filepath)
+    snapshot_state["state_dict"] = load_tensors(filepath, keys, map_location)
+
+    return snapshot_state
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent SQLite index of the snapshots, perf stats files and weight 
+summary sidecars under nets/,
+so discovery code doesn't have to walk the tree or load snapshots to find
+out what they are.
+"""
+import numpy as np
+import os
+import sqlite3
+import time
+import json
+
+try:
+    from .SnapshotIO import load_snapshot_metadata
+except:
+    from SnapshotIO import load_snapshot_metadata
+
+try:
+    from .MetricsLog import MetricsLog, perf_log_name, read_perf_log
+except:
+    from MetricsLog import MetricsLog, perf_log_name, read_perf_log
+
+try:
+    from .WeightSummary import summary_ext
+except:
+    from WeightSummary import summary_ext
+
+try:
+    from .util import get_epoch_from_filename
+except:
+    from util import get_epoch_from_filename
+
+# columns of the files table, in order
+index_cols = ["path", "kind", "dataset", "net_name", "train_scheme", "case_id",
+    "sample", "epoch", "val_acc", "size", "mtime"]
+
+def get_file_kind(filename):
+    """
+    Returns the kind of file the index tracks, or None for anything else
+    """
+    if filename.endswith(summary_ext):
+        return "weight_summary"
+
+    if get_epoch_from_filename(filename) is not None:
+        return "snapshot"
+
+    if filename == "perf_stats.npy":
+        return "perf_stats"
+
+    if filename == perf_log_name:
+        return "perf_log"
+
+    return None
+
+def parse_net_path(rel_path):
+    """
+    Extracts identifying metadata from a path relative to nets/, laid out
+    as [dataset/]net_name/train_scheme/case/sample-N/filename
+    """
+    slugs = rel_path.split(os.sep)
+    dirs = slugs[:-1]
+    metadata = dict()
+
+    if len(dirs) > 0 and dirs[-1].startswith("sample-"):
+        metadata["sample"] = int(dirs[-1].split("-")[-1])
+
+    # older nets were saved without a dataset directory
+    keys = ["dataset", "net_name", "train_scheme", "case_id"]
+    if len(dirs) == 4:
+        keys = keys[1:]
+    
+    if len(dirs) in [4, 5]:
+        metadata.update(zip(keys, dirs[:-1]))
+
+    return metadata
+
+def walk_dirs(top):
+    """
+    Yields (dirpath, mtime_ns, filenames) for top and every directory 
+    under it. Each directory is stat'd before it's listed, so a file added
+    in between makes the recorded mtime stale rather than hiding the file.
+    """
+    stack = [top]
+    while len(stack) > 0:
+        dirpath = stack.pop()
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+            entries = list(os.scandir(dirpath))
+        except FileNotFoundError:
+            continue
+
+        stack.extend(e.path for e in entries if e.is_dir())
+        yield dirpath, mtime, [e.name for e in entries if e.is_file()]
+
+class SnapshotIndex():
+    """
+    One row per snapshot and perf_stats file under nets/. Paths are stored
+    relative to data_dir so the index survives remounting the data.
+    """
+    
+    def __init__(self, data_dir):
+
+        self.data_dir = os.path.expanduser(data_dir)
+        self.nets_dir = os.path.join(self.data_dir, "nets")
+        self.db_path = os.path.join(self.data_dir, "nets_index.sqlite")
+
+    def connect(self):
+
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.row_factory = sqlite3.Row
+        
+        # every time, another process may have created the file but not 
+        # the tables yet
+        conn.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, kind TEXT, dataset TEXT, 
+            net_name TEXT, train_scheme TEXT, case_id TEXT, 
+            sample INTEGER, epoch INTEGER, val_acc REAL, size INTEGER, 
+            mtime REAL)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS files_run ON files 
+            (kind, dataset, net_name, train_scheme, case_id)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY, value INTEGER)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY, mtime INTEGER)""")
+        conn.commit()
+
+        return conn
+
+    def exists(self):
+
+        return os.path.exists(self.db_path)
+
+    def is_reconciled(self):
+        """
+        Whether the index has been built from disk at least once. Saving a
+        file creates the index with just that file's row, so existence 
+        alone doesn't mean it covers older files.
+        """
+        if not self.exists():
+            return False
+
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM meta WHERE key='reconciled'").fetchone()
+        conn.close()
+
+        return row is not None
+
+    def get_generation(self):
+        """
+        Returns a counter that increases every time the index changes
+        """
+        if not self.exists():
+            return 0
+
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+        conn.close()
+
+        return row["value"] if row is not None else 0
+
+    def bump_generation(self, conn):
+
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    def read_metadata(self, filepath, kind):
+        """
+        Reads the metadata the index needs from the file itself
+        """
+        if kind == "snapshot":
+            snapshot = load_snapshot_metadata(filepath)
+            return {
+                "dataset": snapshot.get("dataset"),
+                "net_name": snapshot.get("net_name"),
+                "train_scheme": snapshot.get("train_scheme"),
+                "case_id": snapshot.get("case"),
+                "sample": snapshot.get("sample"),
+                "epoch": snapshot.get("epoch"),
+                "val_acc": snapshot.get("val_acc")
+            }
+
+        if kind == "weight_summary":
+            with open(filepath, "r") as json_file:
+                snapshot = json.load(json_file)["metadata"]
+            return {
+                "dataset": snapshot.get("dataset"),
+                "net_name": snapshot.get("net_name"),
+                "train_scheme": snapshot.get("train_scheme"),
+                "case_id": snapshot.get("case"),
+                "sample": snapshot.get("sample"),
+                "epoch": snapshot.get("epoch"),
+                "val_acc": snapshot.get("val_acc")
+            }
+
+        if kind == "perf_log":
+            metadata = MetricsLog(filepath).metadata or dict()
+            df = read_perf_log(filepath)
+            return {
+                "dataset": metadata.get("dataset"),
+                "net_name": metadata.get("net_name"),
+                "train_scheme": metadata.get("train_scheme"),
+                "case_id": metadata.get("case"),
+                "sample": metadata.get("sample"),
+                "epoch": int(df["epoch"].iloc[-1]) if len(df) > 0 else None,
+                "val_acc": float(df["val_acc"].iloc[-1]) if len(df) > 0 else None
+            }
+
+        stats_dict = np.load(filepath, allow_pickle=True).item()
+        perf_stats = stats_dict.get("perf_stats")
+        return {
+            "dataset": stats_dict.get("dataset"),
+            "net_name": stats_dict.get("net_name"),
+            "train_scheme": stats_dict.get("train_scheme"),
+            "case_id": stats_dict.get("case"),
+            "sample": stats_dict.get("sample"),
+            "epoch": len(perf_stats) - 1,
+            "val_acc": perf_stats[-1][0]
+        }
+
+    def build_row(self, filepath, metadata=None):
+
+        kind = get_file_kind(os.path.basename(filepath))
+        rel_path = os.path.relpath(filepath, self.data_dir)
+
+        if metadata is None:
+            metadata = self.read_metadata(filepath, kind)
+
+        # location in the tree takes precedence, it's what discovery matches
+        row = { k: v for k, v in metadata.items() if v is not None }
+        row.update(parse_net_path(os.path.relpath(filepath, self.nets_dir)))
+        row["path"] = rel_path
+        row["kind"] = kind
+        if kind == "snapshot":
+            row["epoch"] = get_epoch_from_filename(filepath)
+
+        stat = os.stat(filepath)
+        row["size"] = stat.st_size
+        row["mtime"] = stat.st_mtime
+
+        return tuple(row.get(c) for c in index_cols)
+
+    def upsert(self, conn, rows):
+
+        placeholders = ", ".join("?" for _ in index_cols)
+        conn.executemany(f"INSERT OR REPLACE INTO files ({', '.join(index_cols)}) "
+            + f"VALUES ({placeholders})", rows)
+
+    def add_file(self, filepath, metadata=None):
+        """
+        Adds or updates the row for a single file, e.g. right after it's 
+        saved. Failures only print a warning, since reconcile can always
+        rebuild the index from disk.
+        """
+        if get_file_kind(os.path.basename(filepath)) is None:
+            return
+
+        try:
+            row = self.build_row(filepath, metadata)
+            conn = self.connect()
+            with conn:
+                self.upsert(conn, [row])
+                self.bump_generation(conn)
+            conn.close()
+
+        except sqlite3.Error as e:
+            print(f"Failed to index {filepath}: {e}")
+
+    def reconcile(self, full=True):
+        """
+        Brings the index in line with what's on disk. Only files that are
+        new or whose size or mtime changed get read. Unless full, files
+        are only checked in directories whose mtime changed, i.e. that had 
+        files added, removed or replaced (snapshots are saved by replacing).
+        """
+        since = time.time()
+        conn = self.connect()
+        known = { r["path"]: (r["size"], r["mtime"]) for r in 
+            conn.execute("SELECT path, size, mtime FROM files") }
+        known_dirs = { r["path"]: r["mtime"] for r in 
+            conn.execute("SELECT path, mtime FROM dirs") }
+
+        known_by_dir = dict()
+        for rel_path in known:
+            known_by_dir.setdefault(os.path.dirname(rel_path), []).append(rel_path)
+        
+        seen = set()
+        seen_dirs = set()
+        rows = []
+        dir_rows = []
+        for root, mtime, files in walk_dirs(self.nets_dir):
+
+            rel_dir = os.path.relpath(root, self.data_dir)
+            seen_dirs.add(rel_dir)
+            if not full and known_dirs.get(rel_dir) == mtime:
+                seen.update(known_by_dir.get(rel_dir, []))
+                continue
+            dir_rows.append((rel_dir, mtime))
+            
+            for filename in files:
+
+                if get_file_kind(filename) is None:
+                    continue
+
+                filepath = os.path.join(root, filename)
+                rel_path = os.path.relpath(filepath, self.data_dir)
+                seen.add(rel_path)
+
+                stat = os.stat(filepath)
+                if known.get(rel_path) == (stat.st_size, stat.st_mtime):
+                    continue
+                
+                try:
+                    rows.append(self.build_row(filepath))
+                except Exception as e:
+                    print(f"Skipping unreadable file {filepath}: {e}")
+
+        removed = [(p,) for p in known if p not in seen]
+        removed_dirs = [(d,) for d in known_dirs if d not in seen_dirs]
+
+        with conn:
+            self.upsert(conn, rows)
+            conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            conn.executemany("INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)", 
+                dir_rows)
+            conn.executemany("DELETE FROM dirs WHERE path = ?", removed_dirs)
+            if len(rows) > 0 or len(removed) > 0 or len(known) == 0:
+                self.bump_generation(conn)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled', 1)")
+        conn.close()
+
+        if full or len(rows) > 0 or len(removed) > 0:
+            print(f"Reconciled index in {time.time() - since:.1f}s: {len(rows)} "
+                + f"updated, {len(removed)} removed, {len(seen)} total")
+
+    def query(self, kind="snapshot", dataset=None, net_name=None, 
+        train_schemes=None, cases=None, epoch=None):
+        """
+        Returns rows (as dicts, with absolute paths) matching all the given
+        filters. The index is built from disk on first use, and after that
+        picks up files in any directory that changed since the last query.
+        """
+        self.reconcile(full=not self.is_reconciled())
+
+        clauses = ["kind = ?"]
+        params = [kind]
+
+        for col, val in [("dataset", dataset), ("net_name", net_name), 
+            ("epoch", epoch)]:
+            if val is not None:
+                clauses.append(f"{col} = ?")
+                params.append(val)
+
+        for col, vals in [("train_scheme", train_schemes), ("case_id", cases)]:
+            if vals is not None:
+                clauses.append(f"{col} IN ({', '.join('?' for _ in vals)})")
+                params.extend(vals)
+
+        conn = self.connect()
+        cursor = conn.execute(f"SELECT * FROM files WHERE {' AND '.join(clauses)} "
+            + "ORDER BY path", params)
+        rows = [dict(r) for r in cursor]
+        conn.close()
+
+        for row in rows:
+            row["path"] = os.path.join(self.data_dir, row["path"])
+
+        return rows
+
+    def query_runs(self, **kwargs):
+        """
+        Returns a dict of run directory to that run's snapshot rows sorted 
+        by epoch, for snapshots matching the query() filters
+        """
+        runs = dict()
+
+        for row in self.query("snapshot", **kwargs):
+            run_dir = os.path.dirname(row["path"])
+            runs.setdefault(run_dir, []).append(row)
+
+        for rows in runs.values():
+            rows.sort(key=lambda r: r["epoch"])
+
+        return runs
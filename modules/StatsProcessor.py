@@ -2,155 +2,409 @@
 import torch
 import os
 import pandas as pd
-import re
 import numpy as np
 import json
+from concurrent.futures import ProcessPoolExecutor
 
 try:
-    from .NetManager import NetManager, nets
+    from .NetManager import nets
 except:
-    from NetManager import NetManager, nets
+    from NetManager import nets
 
 try:
-    from .MixedActivationLayer import generate_masks
+    from .SegmentStats import get_group_ids, segment_accumulate, acc_abs_mean, acc_abs_sem
 except:
-    from MixedActivationLayer import generate_masks
+    from SegmentStats import get_group_ids, segment_accumulate, acc_abs_mean, acc_abs_sem
 
 try:
-    from .util import ensure_sub_dir
+    from .SnapshotIO import load_snapshot
 except:
-    from util import ensure_sub_dir
+    from SnapshotIO import load_snapshot
 
-def get_epoch_from_filename(filename):
-    
-    epoch = re.search(r"\d+\.pt$", filename)
-    epoch = int(epoch.group().split(".")[0]) if epoch else None
-    
-    return epoch
-    
-def get_first_epoch(net_filenames):
-    
-    for filename in net_filenames:
-        
-        epoch = get_epoch_from_filename(filename)
-        if epoch == 0:
-            return filename
+try:
+    from .WeightSummary import load_weight_summary, stats_mean, stats_sem, is_weight
+except:
+    from WeightSummary import load_weight_summary, stats_mean, stats_sem, is_weight
 
-def get_last_epoch(net_filenames):
-    
-    max_epoch = -1
-    last_net_filename = None
-    
-    for filename in net_filenames:
-        
-        epoch = get_epoch_from_filename(filename)
+try:
+    from .ResultCache import ResultCache, memoize
+except:
+    from ResultCache import ResultCache, memoize
 
-        if epoch is None:
-            continue
+try:
+    from .SnapshotIndex import SnapshotIndex
+except:
+    from SnapshotIndex import SnapshotIndex
 
-        if epoch > max_epoch:
-            max_epoch = epoch
-            last_net_filename = filename
+try:
+    from .MetricsLog import MetricsLog, perf_log_name, read_perf_log
+except:
+    from MetricsLog import MetricsLog, perf_log_name, read_perf_log
 
-    return last_net_filename
+try:
+    from .util import ensure_sub_dir, get_epoch_from_filename
+except:
+    from util import ensure_sub_dir, get_epoch_from_filename
     
-def get_component_cases(case_dict, case):
+def param_key(p):
+    """
+    Normalizes an act fn param so "1", "1.0" and 1 all match
     """
-    Returns the names of cases that compose the given mixed case
+    return "None" if p is None or p == "None" else str(float(p))
+
+def get_component_table(case_dict):
+    """
+    Returns a dataframe pairing each mixed case with its "component" cases,
+    i.e. the single act fn cases for each of its (act fn, param) pairs
 
     Args:
         case_dict (dict)
-        case: the mixed case 
     """
+    fn_rows = [(case, fn, param_key(p)) for case, v in case_dict.items() 
+        for fn, p in zip(v["act_fns"], v["act_fn_params"])]
+    fn_df = pd.DataFrame(fn_rows, columns=["case", "act_fn", "param"])
+    n_fns = fn_df.groupby("case")["act_fn"].transform("size")
+
+    # index from (act fn, param) to the first single fn case using it
+    single_df = fn_df[n_fns == 1].drop_duplicates(["act_fn", "param"])
+    single_df = single_df.rename(columns={ "case": "component_case" })
+
+    # explode mixed cases into their act fns and join
+    mixed_df = fn_df[n_fns > 1]
+    component_df = mixed_df.merge(single_df, on=["act_fn", "param"])
+
+    return component_df[["case", "component_case"]].drop_duplicates()
 
-    # identify "component" cases...
-    def param_to_float(p):
-        return float(p) if p != "None" else p
+def get_component_cases(case_dict, case):
+    """
+    Returns the names of cases that compose the given mixed case, from the
+    component table
+    """
+    component_df = get_component_table(case_dict)
 
-    z = list(zip(case_dict[case]["act_fns"], [param_to_float(p) for p in case_dict[case]["act_fn_params"]]))
-    component_cases = []
+    return list(component_df[component_df["case"] == case]["component_case"])
 
-    for k, v in case_dict.items():
+def bootstrap_predictions(sample_accs, pair_groups, n_groups, n_boot=1000, 
+    ci=0.95, seed=0, max_elements=2**24):
+    """
+    Bootstraps linear (mean) and max predictions for many mixed cases at
+    once. Each (mixed case, component case) pair's sample accuracies are
+    resampled n_boot times, and the resampled component means are reduced
+    per mixed case.
 
-        if len(component_cases) >= len(z):
-            return component_cases
+    Args:
+        sample_accs (list): Array of sample accuracies for each pair.
+        pair_groups (array): Index of each pair's mixed case group.
+        n_groups (int): Number of mixed case groups.
+        max_elements (int): Bounds the size of each batch of resamples.
+
+    Returns:
+        (linear_ci, max_ci): Arrays of shape (n_groups, 2) with the lower and
+            upper bounds of each prediction's confidence interval.
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = len(sample_accs)
+    linear_boot = np.zeros((n_groups, n_boot))
+    max_boot = np.full((n_groups, n_boot), -np.inf)
+    group_sizes = np.bincount(pair_groups, minlength=n_groups)
+
+    # pad to a dense (pair, sample) matrix
+    counts = np.array([len(a) for a in sample_accs])
+    max_n = max(counts.max(), 1) if n_pairs > 0 else 1
+    padded = np.zeros((n_pairs, max_n))
+    for i, a in enumerate(sample_accs):
+        padded[i,:len(a)] = a
+
+    batch_size = max(max_elements // (n_boot * max_n), 1)
+    for start in range(0, n_pairs, batch_size):
+        stop = min(start + batch_size, n_pairs)
+        n = counts[start:stop,None,None]
+
+        # resample with replacement within each pair's own samples
+        idx = (rng.random((stop - start, n_boot, max_n)) * n).astype(int)
+        resampled = np.take_along_axis(padded[start:stop,None,:], idx, axis=2)
+        valid = np.arange(max_n)[None,None,:] < n
+        boot_means = (resampled * valid).sum(axis=2) / n[:,:,0]
+
+        groups = pair_groups[start:stop]
+        np.add.at(linear_boot, groups, boot_means)
+        np.maximum.at(max_boot, groups, boot_means)
+
+    linear_boot /= np.maximum(group_sizes, 1)[:,None]
+    alpha = (1. - ci) / 2.
+    q = [alpha, 1. - alpha]
+
+    return (np.quantile(linear_boot, q, axis=1).T, 
+        np.quantile(max_boot, q, axis=1).T)
+
+def init_worker():
+    """
+    Keeps each pool worker to one thread so workers don't oversubscribe
+    the cpus
+    """
+    torch.set_num_threads(1)
+
+def reduce_final_weights(task):
+    """
+    Map task for load_weight_df: mean absolute weight of each cell type
+    in each layer of a run's final snapshot.
+
+    Args:
+        task (tuple): (snapshot path, state keys to load)
+
+    Returns:
+        weights_arr (list): Rows of [sample, layer, act_fn, avg, sem].
+    """
+    last_net_path, state_keys = task
+    weights_arr = []
+
+    # precomputed summary if there is one
+    summary = load_weight_summary(last_net_path)
+    if summary is not None:
+        sample = summary["metadata"].get("sample")
+        for layer_name in state_keys:
+            if layer_name not in summary["layers"]:
+                continue
+            
+            for cell_type in summary["layers"][layer_name]["cell_types"]:
+                acc = cell_type["weights"]
+                weights_arr.append([sample, layer_name, cell_type["act_fn"], 
+                    stats_mean(acc), stats_sem(acc)])
+
+        return weights_arr
+
+    # load just the weights we want
+    last_net = load_snapshot(last_net_path, state_keys)
+    
+    # separate by cell type
+    sample = last_net.get("sample")
+    modified_layers = last_net["modified_layers"]
+    n_fns = len(modified_layers["act_fns"])
+    n_repeat = modified_layers["n_repeat"]
+
+    # TODO: this will not work for mixing within spatial dim of feature map
+    layer_names = list(last_net["state_dict"].keys())
+    layers = list(last_net["state_dict"].values())
+    group_ids = [get_group_ids(len(layer), n_fns, n_repeat) for layer in layers]
+
+    # weight stats for every layer and cell type at once
+    acc = segment_accumulate(layers, group_ids, n_fns)
+    avg_weights = acc_abs_mean(acc)
+    sem_weights = acc_abs_sem(acc)
+
+    for i, layer_name in enumerate(layer_names):
+        for g, act_fn in enumerate(modified_layers["act_fns"]):
+
+            # add to data array
+            weights_arr.append([sample, layer_name, act_fn, 
+                avg_weights[i, g].item(), sem_weights[i, g].item()])
+
+    return weights_arr
+
+def reduce_weight_change(task):
+    """
+    Map task for load_weight_change_df: mean absolute change of each 
+    layer's weights between a run's first and last snapshots.
+
+    Args:
+        task (tuple): (first snapshot path, last snapshot path)
+
+    Returns:
+        layer_keys (list): Layers in the order of the stats.
+        row (list): [scheme, case, sample] + avg changes + sems.
+    """
+    first_net_path, last_net_path = task
+
+    # precomputed summary if there is one
+    summary = load_weight_summary(last_net_path)
+    if summary is not None and summary["metadata"].get("epoch") != 0:
+        metadata = summary["metadata"]
+        layer_keys = list(summary["layers"].keys())
+        deltas = [summary["layers"][k]["delta"] for k in layer_keys]
         
-        if (len(v["act_fns"]) == 1 
-            and (v["act_fns"][0], param_to_float(v["act_fn_params"][0])) in z):
-            component_cases.append(k)
+        if all(d is not None for d in deltas):
+            avg_weights = [stats_mean(d) for d in deltas]
+            sem_weights = [stats_sem(d) for d in deltas]
+
+            case = metadata.get("case") if metadata.get("case") is not None else "control"
+            sample = metadata.get("sample")
+            scheme = metadata.get("train_scheme") if metadata.get("train_scheme") is not None else "sgd"
+
+            return layer_keys, [scheme, case, sample] + avg_weights + sem_weights
+
+    # load just the weights we want
+    first_net = load_snapshot(first_net_path, is_weight)
+    last_net = load_snapshot(last_net_path, is_weight)
+    layer_keys = list(first_net["state_dict"].keys())
+    
+    # diff weights
+    diff_net = [last_net["state_dict"][layer] - first_net["state_dict"][layer] for layer in layer_keys]
+
+    # avg weights
+    avg_weights = [torch.mean(torch.abs(layer)).item() for layer in diff_net]
+    sem_weights = [torch.std(torch.abs(layer)).item() / np.sqrt(layer.numel()) for layer in diff_net]
+
+    case = first_net.get("case") if first_net.get("case") is not None else "control"
+    sample = first_net.get("sample")
+    scheme = first_net.get("train_scheme") if first_net.get("train_scheme") is not None else "sgd"
+    
+    return layer_keys, [scheme, case, sample] + avg_weights + sem_weights
+
+def reduce_weight_trajectory(snapshot_paths):
+    """
+    Map task for load_weight_trajectory_df: walks a run's snapshots in 
+    epoch order and tracks, for each layer and cell type, the mean absolute
+    change from epoch 0, the step size (L2 norm of the change since the 
+    previous snapshot) and the cosine between consecutive steps. Snapshots
+    are loaded one at a time. Across snapshots the epoch 0 weights, the 
+    previous weights and the previous steps are held, alongside the 
+    snapshot being reduced; changes, steps and step products are then 
+    computed one layer at a time, so temporaries are at most layer sized.
 
-    return component_cases
+    Args:
+        snapshot_paths (list): The run's snapshots, sorted by epoch.
+
+    Returns:
+        traj_arr (list): Rows of [scheme, case, sample, epoch, layer, 
+            act_fn, abs_change, step_size, step_cos].
+    """
+    first_net = load_snapshot(snapshot_paths[0], is_weight)
+    layer_keys = list(first_net["state_dict"].keys())
+    first_weights = [first_net["state_dict"][k].float() for k in layer_keys]
+
+    case = first_net.get("case") if first_net.get("case") is not None else "control"
+    sample = first_net.get("sample")
+    scheme = first_net.get("train_scheme") if first_net.get("train_scheme") is not None else "sgd"
+
+    # cell types, or all channels as one type for unmodified nets
+    modified_layers = first_net.get("modified_layers")
+    if modified_layers is not None:
+        act_fns = modified_layers["act_fns"]
+        n_repeat = modified_layers["n_repeat"]
+    else:
+        act_fns = ["relu"]
+        n_repeat = 1
+    n_fns = len(act_fns)
+    group_ids = [get_group_ids(len(w), n_fns, n_repeat) for w in first_weights]
+
+    traj_arr = []
+    for i, layer_name in enumerate(layer_keys):
+        for act_fn in act_fns:
+            traj_arr.append([scheme, case, sample, first_net.get("epoch", 0), 
+                layer_name, act_fn, 0., np.nan, np.nan])
+
+    prev_weights = list(first_weights)
+    prev_steps = [None] * len(layer_keys)
+    prev_step_sizes = [None] * len(layer_keys)
+    for snapshot_path in snapshot_paths[1:]:
+
+        net = load_snapshot(snapshot_path, is_weight)
+        epoch = net.get("epoch", get_epoch_from_filename(snapshot_path))
+        state_dict = net.pop("state_dict")
+        
+        # reduce change, step and consecutive step products per cell type,
+        # one layer at a time
+        for i, layer_name in enumerate(layer_keys):
+            
+            w = state_dict.pop(layer_name).float()
+            abs_changes = acc_abs_mean(segment_accumulate(w - first_weights[i], 
+                group_ids[i], n_fns))
+            step = w - prev_weights[i]
+            step_sizes = torch.sqrt(segment_accumulate(step, group_ids[i], 
+                n_fns)["sq_sum"])
+
+            if prev_steps[i] is not None:
+                dots = segment_accumulate(step * prev_steps[i], group_ids[i], 
+                    n_fns)["sum"]
+                step_cos = dots / (step_sizes * prev_step_sizes[i])
+            else:
+                step_cos = torch.full_like(step_sizes, np.nan)
+
+            for g, act_fn in enumerate(act_fns):
+                traj_arr.append([scheme, case, sample, epoch, layer_name, act_fn,
+                    abs_changes[g].item(), step_sizes[g].item(), 
+                    step_cos[g].item()])
+
+            prev_weights[i] = w
+            prev_steps[i] = step
+            prev_step_sizes[i] = step_sizes
+
+    return traj_arr
+
+# column types of the weight trajectory table
+weight_traj_dtypes = {
+    "train_scheme": "category",
+    "case": "category",
+    "sample": "Int64",
+    "epoch": "int32",
+    "layer": "category",
+    "act_fn": "category",
+    "abs_change": "float32",
+    "step_size": "float32",
+    "step_cos": "float32"
+}
+
+# column types of the final accuracy table
+final_acc_dtypes = {
+    "dataset": "string",
+    "net_name": "string",
+    "train_scheme": "string",
+    "case": "string",
+    "sample": "Int64",
+    "final_val_acc": "float64",
+    "path": "string",
+    "size": "int64",
+    "mtime": "float64"
+}
 
 class StatsProcessor():
     """
     Class to handle processing network snapshots into meaningful statistics.
     """
     
-    def __init__(self, data_dir, n_classes):
+    def __init__(self, data_dir, n_classes, n_workers=1, 
+        cache_bytes=512 * 2**20):
         
         self.data_dir = data_dir
         self.n_classes = n_classes
+        self.n_workers = n_workers
+        self.index = SnapshotIndex(data_dir)
+        self.cache = ResultCache(cache_bytes)
+
+    def get_data_version(self):
+        """
+        Stamp for memoized results, which bumps whenever the snapshot index
+        picks up new, changed or removed files
+        """
+        return self.index.get_generation()
+
+    def map_runs(self, fn, tasks):
+        """
+        Applies fn to each task, on a pool of n_workers processes if more 
+        than one. Results come back in task order regardless. Each worker
+        only holds the run it's currently reducing.
+        """
+        if self.n_workers <= 1 or len(tasks) <= 1:
+            return [fn(task) for task in tasks]
+
+        with ProcessPoolExecutor(max_workers=self.n_workers, 
+            initializer=init_worker) as executor:
+            return list(executor.map(fn, tasks, chunksize=1))
     
+    @memoize
     def load_weight_df(self, net_name, case, train_schemes):
         """
         Loads a dataframe containing the mean absolute weights for each
         cell type across layers
         """
-        # for loading nets/metadata
-        mgr = NetManager(net_name, self.n_classes, self.data_dir, None)
-
-        weights_arr = []
         state_keys = list(nets["vgg11"]["state_keys"].keys())
 
-        # walk dir for final snapshots
-        net_dir = os.path.join(self.data_dir, f"nets/{net_name}")
-        for root, dirs, files in os.walk(net_dir):
-        
-            # only interested in locations files (nets) are saved
-            if len(files) <= 0:
-                continue
-
-            slugs = root.split("/")
-
-            # only interested in the given training schemes
-            if not any(t in slugs for t in train_schemes):
-                continue
-
-            # only interested in the given case
-            if not case in slugs:
-                continue
-            
-            # get final snapshot
-            last_net_filename = get_last_epoch(files)
-            if last_net_filename is None:
-                continue
-            
-            last_net_path = os.path.join(root, last_net_filename)
-            last_net = mgr.load_snapshot_metadata(last_net_path, True)
-            
-            # filter to just the weights we want
-            last_net["state_dict"] = { my_key: last_net["state_dict"][my_key] for my_key in state_keys }
-            
-            # separate by cell type
-            sample = last_net.get("sample")
-            modified_layers = last_net["modified_layers"]
-            n_fns = len(modified_layers["act_fns"])
-            n_repeat = modified_layers["n_repeat"]
-
-            for layer_name, layer in last_net["state_dict"].items():
-                
-                n_features = len(layer) # TODO: this will not work for mixing within spatial dim of feature map
-                masks = generate_masks(n_features, n_fns, n_repeat)
-
-                for mask, act_fn in zip(masks, modified_layers["act_fns"]):
-
-                    # weight stats
-                    cells = layer[mask]
-                    avg_weight = torch.mean(torch.abs(cells)).item()
-                    sem_weight = torch.std(torch.abs(cells)).item() / np.sqrt(cells.numel())
-
-                    # add to data array
-                    weights_arr.append([sample, layer_name, act_fn, avg_weight, sem_weight])
+        # reduce final snapshot of each run
+        runs = self.index.query_runs(net_name=net_name, 
+            train_schemes=train_schemes, cases=[case])
+        tasks = [(snapshots[-1]["path"], state_keys) for snapshots in runs.values()]
+        results = self.map_runs(reduce_final_weights, tasks)
+        weights_arr = [row for rows in results for row in rows]
 
         # make df
         cols = ["sample", "layer", "act_fn", "avg_weight", "sem_weight"]
@@ -163,6 +417,7 @@ class StatsProcessor():
 
         return df_stats
 
+    @memoize
     def load_weight_change_df(self, net_name, case_ids, train_schemes):
         """
         Loads a dataframe containing the mean, absolute weight changes
@@ -175,59 +430,20 @@ class StatsProcessor():
             weight_change_df (dataframe).
 
         """
-        # for loading nets/metadata
-        mgr = NetManager(net_name, self.n_classes, self.data_dir, None)
-
-        weight_change_arr = []
+        # diff first and last snapshot of each run
+        runs = self.index.query_runs(net_name=net_name, 
+            train_schemes=train_schemes, cases=case_ids)
+        tasks = [(snapshots[0]["path"], snapshots[-1]["path"]) 
+            for snapshots in runs.values() if snapshots[0]["epoch"] == 0]
+        results = self.map_runs(reduce_weight_change, tasks)
         
-        # walk dir looking for net snapshots
-        net_dir = os.path.join(self.data_dir, f"nets/{net_name}")
-        for root, dirs, files in os.walk(net_dir):
-            
-            # only interested in locations files (nets) are saved
-            if len(files) <= 0:
-                continue
+        # no matching runs, so no layers either
+        if len(results) == 0:
+            index = pd.MultiIndex.from_tuples([], names=["train_scheme", "case"])
+            return pd.DataFrame(index=index)
 
-            slugs = root.split("/")
-
-            # only interested in the given training schemes
-            if not any(t in slugs for t in train_schemes):
-                continue
-
-            # only interested in the given cases
-            if not any(c in slugs for c in case_ids):
-                continue
-            
-            # nets are all from one sample, get just the first and last
-            first_net_filename = get_first_epoch(files)
-            last_net_filename = get_last_epoch(files)
-            
-            if first_net_filename is None or last_net_filename is None:
-                continue
-
-            first_net_path = os.path.join(root, first_net_filename)
-            last_net_path = os.path.join(root, last_net_filename)
-            
-            first_net = mgr.load_snapshot_metadata(first_net_path, True)
-            last_net = mgr.load_snapshot_metadata(last_net_path, True)
-            
-            # filter to just the weights we want
-            layer_keys = [k for k in first_net["state_dict"].keys() if k.endswith(".weight")]
-            first_net["state_dict"] = { k: first_net["state_dict"][k] for k in layer_keys }
-            last_net["state_dict"] = { k: last_net["state_dict"][k] for k in layer_keys }
-            
-            # diff weights
-            diff_net = [last_net["state_dict"][layer] - first_net["state_dict"][layer] for layer in layer_keys]
-
-            # avg weights
-            avg_weights = [torch.mean(torch.abs(layer)).item() for layer in diff_net]
-            sem_weights = [torch.std(torch.abs(layer)).item() / np.sqrt(layer.numel()) for layer in diff_net]
-
-            # add to arr
-            case = first_net.get("case") if first_net.get("case") is not None else "control"
-            sample = first_net.get("sample")
-            scheme = first_net.get("train_scheme") if first_net.get("train_scheme") is not None else "sgd"
-            weight_change_arr.append([scheme, case, sample] + avg_weights + sem_weights)
+        layer_keys = results[0][0]
+        weight_change_arr = [row for _, row in results]
 
         # make df
         layer_keys = layer_keys + [f"{key}.sem" for key in layer_keys]
@@ -241,13 +457,41 @@ class StatsProcessor():
 
         return df_stats
     
-    def load_final_acc_df(self, refresh_df=True):
+    @memoize
+    def load_weight_trajectory_df(self, net_name, case_ids, train_schemes):
+        """
+        Loads a dataframe of per-epoch weight trajectories for each layer
+        and cell type of each run: mean absolute change from epoch 0, step
+        size and cosine between consecutive steps. Runs are streamed one
+        snapshot at a time, in parallel across runs.
+
+        Args:
+            case_ids (list): Experimental cases to include.
+
+        Returns:
+            traj_df (dataframe): One row per run, epoch, layer and cell type.
+        """
+        runs = self.index.query_runs(net_name=net_name, 
+            train_schemes=train_schemes, cases=case_ids)
+        tasks = [[row["path"] for row in snapshots] 
+            for snapshots in runs.values() if snapshots[0]["epoch"] == 0]
+        results = self.map_runs(reduce_weight_trajectory, tasks)
+
+        traj_df = pd.DataFrame([row for rows in results for row in rows], 
+            columns=list(weight_traj_dtypes.keys()))
+
+        return traj_df.astype(weight_traj_dtypes)
+
+    @memoize
+    def load_final_acc_df(self, refresh_df=True, n_boot=1000, ci=0.95):
         """
         Loads dataframe with final validation accuracy for different 
         experimental cases.
 
         Args:
             refresh
+            n_boot (int): Bootstrap resamples for prediction intervals.
+            ci (float): Confidence level of prediction intervals.
 
         Returns:
             df_stats (dataframe): Dataframe containing final accuracy.
@@ -259,114 +503,191 @@ class StatsProcessor():
             self.refresh_final_acc_df()
 
         # load
-        sub_dir = os.path.join(self.data_dir, "dataframes/")
-        acc_df = pd.read_csv(os.path.join(sub_dir, "final_acc_df.csv"))
-        with open(os.path.join(sub_dir, "case_dict.json"), "r") as json_file:
-            case_dict = json.load(json_file)
+        acc_df = self.load_table("final_acc_df")
+        case_dict = self.load_json("case_dict.json")
 
         # process
         # 1. mark mixed nets
-        acc_df.drop(columns="Unnamed: 0", inplace=True)
+        acc_df.drop(columns=["path", "size", "mtime"], inplace=True)
         acc_df["is_mixed"] = [len(case_dict[c]["act_fns"]) > 1 if case_dict.get(c) is not None else False for c in acc_df["case"]]
 
         # 2. aggregate
         idx_cols = ["dataset", "net_name", "train_scheme", "case", "is_mixed"]
         df_stats = acc_df.groupby(idx_cols).agg(
             { "final_val_acc": [np.mean, np.std] })
-        df_groups = df_stats.groupby(idx_cols)
-
-        # 3. predictions
-        linear_preds = []
-        linear_stds = []
-        max_preds = []
-        max_stds = []
-        for g in df_groups.groups:
-            d, n, s, c, m = g
-
-            # only predict for mixed cases
-            if not m:
-                linear_preds.append(None)
-                max_preds.append(None)
-                linear_stds.append(None)
-                max_stds.append(None)
-                continue
-            
-            # get component cases and their stats
-            component_cases = get_component_cases(case_dict, c)
-            component_accs = df_stats["final_val_acc"]["mean"][d][n][s].get(component_cases)
-            component_stds = df_stats["final_val_acc"]["std"][d][n][s].get(component_cases)
-
-            # this shouldn't happen much
-            if component_accs is None or len(component_cases) == 0:
-                linear_preds.append(None)
-                max_preds.append(None)
-                linear_stds.append(None)
-                max_stds.append(None)
-                print(f"Component case accuracies do not exist for: {d} {n} {s} {c}")
-                continue
-            
-            # predictions!
-            linear_preds.append(component_accs.mean())
-            max_preds.append(component_accs.max())
-            linear_stds.append(component_stds.mean())
-            max_stds.append(component_stds[component_accs.to_list().index(component_accs.max())])
 
-        df_stats["linear_pred"] = linear_preds
-        df_stats["max_pred"] = max_preds
-        df_stats["linear_std"] = linear_stds
-        df_stats["max_std"] = max_stds
+        # 3. predictions, from the stats of each mixed case's components
+        stats_df = df_stats["final_val_acc"].reset_index()
+        mixed_df = stats_df[stats_df["is_mixed"]][idx_cols[:4]]
+        comp_df = mixed_df.merge(get_component_table(case_dict), on="case")
+        comp_df = comp_df.merge(stats_df[idx_cols[:4] + ["mean", "std"]]
+            .rename(columns={ "case": "component_case" }),
+            on=idx_cols[:3] + ["component_case"])
+
+        # this shouldn't happen much
+        missing = mixed_df.merge(comp_df[idx_cols[:4]].drop_duplicates(), 
+            how="left", indicator=True)
+        for row in missing[missing["_merge"] == "left_only"].itertuples():
+            print(f"Component case accuracies do not exist for: {row.dataset} "
+                + f"{row.net_name} {row.train_scheme} {row.case}")
+        
+        # predictions!
+        comp_groups = comp_df.groupby(idx_cols[:4])
+        pred_df = comp_groups.agg(linear_pred=("mean", "mean"), 
+            max_pred=("mean", "max"), linear_std=("std", "mean"))
+        max_idx = comp_groups["mean"].idxmax()
+        pred_df["max_std"] = comp_df.loc[max_idx.values, "std"].values
+
+        # bootstrap confidence intervals over component samples
+        pred_df = pred_df.reset_index()
+        if len(pred_df) > 0:
+            group_ids = pd.Series(np.arange(len(pred_df)), 
+                index=pd.MultiIndex.from_frame(pred_df[idx_cols[:4]]))
+            pair_groups = group_ids.loc[pd.MultiIndex.from_frame(
+                comp_df[idx_cols[:4]])].values
+            sample_accs = acc_df.groupby(idx_cols[:4])["final_val_acc"].apply(
+                lambda x: x.dropna().values)
+            pair_accs = sample_accs.loc[pd.MultiIndex.from_frame(
+                comp_df[idx_cols[:3] + ["component_case"]])].to_list()
+            (linear_ci, max_ci) = bootstrap_predictions(pair_accs, 
+                pair_groups, len(pred_df), n_boot, ci)
+            pred_df["linear_ci_low"] = linear_ci[:,0]
+            pred_df["linear_ci_high"] = linear_ci[:,1]
+            pred_df["max_ci_low"] = max_ci[:,0]
+            pred_df["max_ci_high"] = max_ci[:,1]
+
+        # line predictions up with the stats, NaN for non-mixed cases
+        pred_cols = ["linear_pred", "max_pred", "linear_std", "max_std", 
+            "linear_ci_low", "linear_ci_high", "max_ci_low", "max_ci_high"]
+        pred_df = stats_df[idx_cols].merge(pred_df, how="left", on=idx_cols[:4])
+        for col in pred_cols:
+            df_stats[col] = pred_df[col].values if col in pred_df else np.nan
 
         return df_stats, case_dict, idx_cols
 
     def refresh_final_acc_df(self):
         """
-        Refreshes dataframe with final validation accuracy.
+        Incrementally refreshes the table of final validation accuracy. Only
+        perf_stats files that are new, or whose size or mtime changed since 
+        the last refresh, are read.
         """
 
+        acc_df = self.load_table("final_acc_df")
+        case_dict = self.load_json("case_dict.json")
+        if acc_df is None:
+            acc_df = pd.DataFrame(columns=list(final_acc_dtypes.keys()))
+        if case_dict is None:
+            case_dict = dict()
+        
+        # rows from tables that stringified missing values get read again
+        str_cols = ["dataset", "net_name", "train_scheme", "case"]
+        legacy = (acc_df[str_cols].astype(object) == "None").any(axis=1)
+        known = { p: (size, mtime) for p, size, mtime in 
+            zip(acc_df["path"][~legacy], acc_df["size"][~legacy], 
+            acc_df["mtime"][~legacy]) }
+        unchanged = set()
         acc_arr = []
-        case_dict = dict()
 
-        # walk dir looking for saved net stats
-        net_dir = os.path.join(self.data_dir, f"nets/")
-        for root, dirs, files in os.walk(net_dir):
+        # all saved net stats
+        for row in self.index.query("perf_stats"):
             
-            # only interested in locations files are saved
-            if len(files) <= 0:
+            filepath = row["path"]
+            rel_path = os.path.relpath(filepath, self.data_dir)
+            if not os.path.exists(filepath):
                 continue
-            
-            # consider all files...
-            for filename in files:
-
-                # ...as long as they are perf_stats
-                if not "perf_stats" in filename:
-                    continue
-                
-                filepath = os.path.join(root, filename)
+
+            stat = os.stat(filepath)
+            if known.get(rel_path) == (stat.st_size, stat.st_mtime):
+                unchanged.add(rel_path)
+                continue
+
+            # prefer the run's perf log, which reads without unpickling
+            log_filepath = os.path.join(os.path.dirname(filepath), perf_log_name)
+            if os.path.exists(log_filepath):
+                stats_dict = MetricsLog(log_filepath).metadata or dict()
+                perf_df = read_perf_log(log_filepath)
+                stats_dict["perf_stats"] = perf_df[["val_acc", "val_loss", 
+                    "train_acc", "train_loss"]].values
+            else:
                 stats_dict = np.load(filepath, allow_pickle=True).item()
-                
-                # extract data
-                dataset = stats_dict.get("dataset") if stats_dict.get("dataset") is not None else "imagenette2"
-                net_name = stats_dict.get("net_name")
-                train_scheme = stats_dict.get("train_scheme") if stats_dict.get("train_scheme") is not None else "sgd"
-                case = stats_dict.get("case")
-                sample = stats_dict.get("sample")
-                modified_layers = stats_dict.get("modified_layers")
-                if modified_layers is not None:
-                    case_dict[case] = {
-                        "act_fns": modified_layers.get("act_fns"),
-                        "act_fn_params": modified_layers.get("act_fn_params")
-                    }
-
-                perf_stats = stats_dict.get("perf_stats")
-                (val_acc, val_loss, train_acc, train_loss) = perf_stats[-1]
-                acc_arr.append([dataset, net_name, train_scheme, case, sample, val_acc])
-                
-        # make dataframe
-        acc_df = pd.DataFrame(acc_arr, columns=["dataset", "net_name", "train_scheme", "case", "sample", "final_val_acc"])
+            
+            # extract data
+            dataset = stats_dict.get("dataset") if stats_dict.get("dataset") is not None else "imagenette2"
+            net_name = stats_dict.get("net_name") if stats_dict.get("net_name") is not None else row["net_name"]
+            train_scheme = stats_dict.get("train_scheme") if stats_dict.get("train_scheme") is not None else "sgd"
+            case = stats_dict.get("case") if stats_dict.get("case") is not None else row["case_id"]
+            case = case if case is not None else "control"
+            sample = stats_dict.get("sample")
+            modified_layers = stats_dict.get("modified_layers")
+            if modified_layers is not None:
+                case_dict[case] = {
+                    "act_fns": modified_layers.get("act_fns"),
+                    "act_fn_params": modified_layers.get("act_fn_params")
+                }
+
+            perf_stats = stats_dict.get("perf_stats")
+            (val_acc, val_loss, train_acc, train_loss) = perf_stats[-1]
+            acc_arr.append([dataset, net_name, train_scheme, case, sample, 
+                val_acc, rel_path, stat.st_size, stat.st_mtime])
+
+        n_dropped = len(acc_df) - len(unchanged)
+        print(f"Refreshing final accuracy: {len(acc_arr)} files read, " 
+            + f"{len(unchanged)} unchanged")
+
+        # nothing to do
+        if len(acc_arr) == 0 and n_dropped == 0:
+            return
+            
+        # merge new rows into the unchanged ones
+        new_df = pd.DataFrame(acc_arr, columns=list(final_acc_dtypes.keys()))
+        acc_df = pd.concat([acc_df[acc_df["path"].isin(unchanged)], new_df], 
+            ignore_index=True)
+        acc_df = acc_df.astype(final_acc_dtypes)
+
+        # forget cases whose runs are gone
+        cases = set(acc_df["case"].dropna())
+        case_dict = { c: v for c, v in case_dict.items() if c in cases }
 
-        self.save_df("final_acc_df.csv", acc_df)
+        self.save_table("final_acc_df", acc_df)
         self.save_json("case_dict.json", case_dict)
 
+    def save_table(self, name, df):
+        """
+        Saves df as a typed, columnar Feather file, or a pickle if pyarrow 
+        isn't available
+        """
+        sub_dir = ensure_sub_dir(self.data_dir, "dataframes/")
+        
+        try:
+            df.reset_index(drop=True).to_feather(os.path.join(sub_dir, f"{name}.feather"))
+        except ImportError:
+            df.to_pickle(os.path.join(sub_dir, f"{name}.pkl"))
+
+    def load_table(self, name):
+        """
+        Loads a table saved by save_table, or None if it doesn't exist
+        """
+        sub_dir = os.path.join(self.data_dir, "dataframes/")
+        feather_path = os.path.join(sub_dir, f"{name}.feather")
+        pickle_path = os.path.join(sub_dir, f"{name}.pkl")
+
+        if os.path.exists(feather_path):
+            return pd.read_feather(feather_path)
+        
+        if os.path.exists(pickle_path):
+            return pd.read_pickle(pickle_path)
+
+        return None
+
+    def load_json(self, name):
+
+        filename = os.path.join(self.data_dir, "dataframes/", name)
+        if not os.path.exists(filename):
+            return None
+        
+        with open(filename, "r") as json_file:
+            return json.load(json_file)
+
     def save_df(self, name, df):
 
         sub_dir = ensure_sub_dir(self.data_dir, f"dataframes/")
@@ -381,6 +702,7 @@ class StatsProcessor():
         with open(filename, "w") as json_file:
             json_file.write(json_obj)
 
+    @memoize
     def load_accuracy_df(self, dataset, net_name, cases, train_schemes):
         """
         Loads dataframe with accuracy over training for different experimental 
@@ -394,46 +716,54 @@ class StatsProcessor():
             acc_df (dataframe): Dataframe containing validation accuracy.
         """
         acc_arr = []
+        columns = ["train_scheme", "case", "sample", "epoch", "acc"]
+
+        # perf logs, which also cover runs still in training
+        log_dirs = set()
+        for row in self.index.query("perf_log", dataset=dataset, 
+            net_name=net_name, train_schemes=train_schemes, cases=cases):
+
+            filepath = row["path"]
+            log_dirs.add(os.path.dirname(filepath))
+            perf_df = read_perf_log(filepath)
+
+            train_scheme = row["train_scheme"] if row["train_scheme"] is not None else "sgd"
+            acc_arr.append(pd.DataFrame({
+                "train_scheme": train_scheme,
+                "case": row["case_id"],
+                "sample": row["sample"],
+                "epoch": perf_df["epoch"].values,
+                "acc": perf_df["val_acc"].values
+            }, columns=columns))
             
-        # walk dir looking for saved net stats
-        net_dir = os.path.join(self.data_dir, f"nets/{dataset}/{net_name}")
-        for root, dirs, files in os.walk(net_dir):
+        # saved net stats for the given schemes and cases, for older runs
+        for row in self.index.query("perf_stats", dataset=dataset, 
+            net_name=net_name, train_schemes=train_schemes, cases=cases):
             
-            # only interested in locations files are saved
-            if len(files) <= 0:
-                continue
-            
-            slugs = root.split("/")
-
-            # only interested in the given training schemes
-            if not any(t in slugs for t in train_schemes):
+            filepath = row["path"]
+            if os.path.dirname(filepath) in log_dirs:
                 continue
 
-            # only interested in the given cases
-            if not any(c in slugs for c in cases):
-                continue
+            stats_dict = np.load(filepath, allow_pickle=True).item()
+            
+            train_scheme = stats_dict.get("train_scheme") if stats_dict.get("train_scheme") is not None else "sgd"
+            case = stats_dict.get("case")
+            sample = stats_dict.get("sample")
+
+            perf_stats = stats_dict.get("perf_stats")
+            acc_arr.append(pd.DataFrame({
+                "train_scheme": train_scheme,
+                "case": case,
+                "sample": sample,
+                "epoch": np.arange(len(perf_stats)),
+                "acc": [stats[0] for stats in perf_stats]
+            }, columns=columns))
             
-            # consider all files...
-            for filename in files:
-
-                # ...as long as they are perf_stats
-                if not "perf_stats" in filename:
-                    continue
-                
-                filepath = os.path.join(root, filename)
-                stats_dict = np.load(filepath, allow_pickle=True).item()
-                
-                train_scheme = stats_dict.get("train_scheme") if stats_dict.get("train_scheme") is not None else "sgd"
-                case = stats_dict.get("case")
-                sample = stats_dict.get("sample")
-
-                perf_stats = stats_dict.get("perf_stats")
-                for epoch in range(len(perf_stats)):
-                    (val_acc, val_loss, train_acc, train_loss) = perf_stats[epoch]
-                    acc_arr.append([train_scheme, case, sample, epoch, val_acc])
-                
         # make dataframe
-        acc_df = pd.DataFrame(acc_arr, columns=["train_scheme", "case", "sample", "epoch", "acc"])  
+        if len(acc_arr) == 0:
+            return pd.DataFrame(columns=columns)
+
+        acc_df = pd.concat(acc_arr, ignore_index=True)
         return acc_df
 
 if __name__=="__main__":
@@ -41,42 +41,16 @@ def get_key(dct, val):
             return k
         return None
 
-def get_component_cases(case_dict, case):
-    """
-    Returns the names of cases that compose the given mixed case
-
-    Args:
-        case_dict (dict)
-        case: the mixed case 
-    """
-
-    # identify "component" cases...
-    def param_to_float(p):
-        return float(p) if p != "None" else p
-
-    z = list(zip(case_dict[case]["act_fns"], [param_to_float(p) for p in case_dict[case]["act_fn_params"]]))
-    component_cases = []
-
-    for k, v in case_dict.items():
-
-        if len(component_cases) >= len(z):
-            return component_cases
-        
-        if (len(v["act_fns"]) == 1 
-            and (v["act_fns"][0], param_to_float(v["act_fn_params"][0])) in z):
-            component_cases.append(k)
-
-    return component_cases
-
 class Visualizer():
     
-    def __init__(self, data_dir, n_classes=10, save_fig=False, refresh=False):
+    def __init__(self, data_dir, n_classes=10, save_fig=False, refresh=False,
+        n_workers=1):
         
         self.data_dir = data_dir
         self.save_fig = save_fig
         self.refresh = refresh
         
-        self.stats_processor = StatsProcessor(data_dir, n_classes)
+        self.stats_processor = StatsProcessor(data_dir, n_classes, n_workers)
         
     def plot_activation_fns(self, act_fns):
         """
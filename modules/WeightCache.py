@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local, content-addressed cache of pretrained weights so net generation can
+run offline and each process deserializes a given set of weights only once.
+"""
+import torch
+from torchvision import models
+import os
+import json
+import hashlib
+
+try:
+    from .util import ensure_sub_dir
+except:
+    from util import ensure_sub_dir
+
+# state dicts already loaded by this process, keyed by content digest
+loaded_states = dict()
+
+def hash_file(filepath, chunk_size=1 << 20):
+    """
+    Returns the sha256 hex digest of the file at filepath
+    """
+    digest = hashlib.sha256()
+
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+class WeightCache():
+    """
+    Stores pretrained state dicts under weight_cache/ named by the sha256 of
+    their contents, with index.json mapping architecture names to digests.
+    """
+
+    def __init__(self, data_dir, offline=False):
+
+        self.data_dir = data_dir
+        self.cache_dir = os.path.join(data_dir, "weight_cache/")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.offline = offline
+
+    def load_index(self):
+
+        if not os.path.exists(self.index_path):
+            return dict()
+
+        with open(self.index_path, "r") as json_file:
+            return json.load(json_file)
+
+    def save_index(self, index):
+
+        tmp_path = self.index_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(index, json_file, indent=4)
+
+        os.replace(tmp_path, self.index_path)
+
+    def get_state(self, arch):
+        """
+        Returns the pretrained state dict for arch, loading it from the cache
+        at most once per process. On a cache miss the weights are fetched 
+        through torchvision and added, unless the cache is offline.
+
+        The returned dict is shared, so load it into a net rather than 
+        modifying it.
+        """
+        digest = self.load_index().get(arch)
+
+        if digest is None:
+            if self.offline:
+                raise FileNotFoundError(f"No cached weights for {arch} in "
+                    + f"{self.cache_dir}, run once with network access first.")
+            
+            print(f"Fetching pretrained {arch} weights for the weight cache")
+            state_dict = getattr(models, arch)(pretrained=True).state_dict()
+            digest = self.put(arch, state_dict)
+            loaded_states[digest] = state_dict
+        
+        if digest not in loaded_states:
+            loaded_states[digest] = self.load_object(digest)
+
+        return loaded_states[digest]
+
+    def load_object(self, digest):
+        """
+        Loads and verifies the cached object with the given digest
+        """
+        filepath = os.path.join(self.cache_dir, f"{digest}.pt")
+        
+        if hash_file(filepath) != digest:
+            raise ValueError(f"Cached weights {filepath} are corrupt, "
+                + "delete the file and its index entry to refetch.")
+
+        print(f"Loading cached weights {filepath}")
+        return torch.load(filepath, map_location="cpu")
+
+    def put(self, arch, state_dict):
+        """
+        Adds state_dict to the cache under arch and returns its digest
+        """
+        ensure_sub_dir(self.data_dir, "weight_cache/")
+        tmp_path = os.path.join(self.cache_dir, f"{arch}.{os.getpid()}.tmp")
+        torch.save(state_dict, tmp_path)
+        
+        digest = hash_file(tmp_path)
+        os.replace(tmp_path, os.path.join(self.cache_dir, f"{digest}.pt"))
+
+        index = self.load_index()
+        index[arch] = digest
+        self.save_index(index)
+
+        return digest
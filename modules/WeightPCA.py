@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Out-of-core PCA of network trajectories through weight space. Each snapshot
+is streamed once into a fixed-size CountSketch of its weights (which 
+preserves inner products, and so distances and principal directions, in
+expectation), sketches are cached per snapshot, and PCA runs on the small
+(snapshots x sketch_dim) matrix.
+"""
+import torch
+import numpy as np
+import pandas as pd
+import os
+import json
+import zlib
+import hashlib
+
+try:
+    from .util import ensure_sub_dir
+except:
+    from util import ensure_sub_dir
+
+def count_sketch(state_dict, sketch_dim, seed=0, chunk_size=1 << 22):
+    """
+    Hashes every weight into one of sketch_dim buckets with a random sign.
+    Bucket assignments are regenerated from the seed and tensor name, so
+    they match across snapshots without ever being stored, and large 
+    tensors are sketched in chunks to bound memory.
+    """
+    sketch = torch.zeros(sketch_dim, dtype=torch.float64)
+
+    for key in sorted(state_dict.keys()):
+
+        tensor = state_dict[key]
+        if not torch.is_floating_point(tensor):
+            continue
+
+        flat = tensor.detach().cpu().reshape(-1)
+        gen = torch.Generator().manual_seed(seed * 2**32 + zlib.crc32(key.encode()))
+
+        for start in range(0, len(flat), chunk_size):
+            chunk = flat[start:start + chunk_size].double()
+            buckets = torch.randint(sketch_dim, (len(chunk),), generator=gen)
+            signs = torch.randint(2, (len(chunk),), generator=gen) * 2. - 1.
+            sketch.index_add_(0, buckets, chunk * signs)
+
+    return sketch.numpy()
+
+class WeightPCA():
+    """
+    Projects snapshots onto the top principal components of their weights.
+
+    Args:
+        manager (NetManager): Used to load snapshots.
+        sketch_dim (int): Size of each snapshot's sketch.
+        state_keys (list): Only use these tensors (e.g. the keys of 
+            nets[net_name]["state_keys"]), all weights if None.
+        seed (int)
+    """
+
+    def __init__(self, manager, sketch_dim=4096, state_keys=None, seed=0):
+
+        self.manager = manager
+        self.sketch_dim = sketch_dim
+        self.state_keys = sorted(state_keys) if state_keys is not None else None
+        self.seed = seed
+        self.cache_dir = os.path.join(manager.data_dir, "pca_cache/")
+
+    def get_cache_key(self, *parts):
+
+        blob = json.dumps([self.sketch_dim, self.state_keys, self.seed] 
+            + list(parts))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+    def get_snapshot_key(self, filepath):
+        """
+        Identifies a snapshot version by path, size and mtime
+        """
+        stat = os.stat(filepath)
+        return self.get_cache_key(os.path.abspath(filepath), stat.st_size, 
+            stat.st_mtime)
+
+    def sketch_snapshot(self, filepath):
+        """
+        Returns a snapshot's weight sketch, from the cache if possible
+        """
+        cache_path = os.path.join(self.cache_dir, 
+            f"{self.get_snapshot_key(filepath)}.npy")
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+        keys = self.state_keys
+        if keys is None:
+            keys = lambda k: k.endswith(".weight")
+        snapshot = self.manager.load_snapshot_metadata(filepath, True, keys)
+        sketch = count_sketch(snapshot["state_dict"], self.sketch_dim, self.seed)
+        
+        ensure_sub_dir(self.manager.data_dir, "pca_cache/")
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, sketch)
+        os.replace(tmp_path, cache_path)
+
+        return sketch
+
+    def fit_transform(self, filepaths, n_components=3):
+        """
+        Fits PCA to the given snapshots (in one shared space, so different
+        runs and cases can be compared) and projects each onto the top 
+        n_components. Projections are cached for the exact set of snapshot
+        versions.
+
+        Returns:
+            projections (array): (n_snapshots, n_components)
+            explained (array): Explained variance ratio of each component.
+        """
+        keys = [self.get_snapshot_key(p) for p in filepaths]
+        cache_path = os.path.join(self.cache_dir, 
+            f"proj_{self.get_cache_key(keys, n_components)}.npz")
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            return cached["projections"], cached["explained"]
+
+        # one snapshot in memory at a time
+        sketches = np.stack([self.sketch_snapshot(p) for p in filepaths])
+
+        # pca in sketch space
+        centered = sketches - sketches.mean(axis=0)
+        u, s, vt = np.linalg.svd(centered, full_matrices=False)
+        
+        # deterministic signs, largest score of each component positive
+        signs = np.sign(u[np.abs(u).argmax(axis=0), range(u.shape[1])])
+        u *= np.where(signs == 0, 1, signs)
+        n_components = min(n_components, len(s))
+        projections = u[:,:n_components] * s[:n_components]
+        var = s ** 2
+        explained = var[:n_components] / max(var.sum(), np.finfo(float).tiny)
+
+        ensure_sub_dir(self.manager.data_dir, "pca_cache/")
+        np.savez(cache_path, projections=projections, explained=explained)
+
+        return projections, explained
+
+    def transform_runs(self, runs, n_components=3):
+        """
+        Fits and projects every snapshot of the given runs, e.g. from 
+        SnapshotIndex.query_runs.
+
+        Returns:
+            pca_df (dataframe): One row per snapshot, with its run's 
+                identifiers, epoch and pc1..pcN.
+            explained (array)
+        """
+        rows = [row for snapshots in runs.values() for row in snapshots]
+        projections, explained = self.fit_transform([r["path"] for r in rows], 
+            n_components)
+
+        pca_df = pd.DataFrame({
+            "train_scheme": [r["train_scheme"] for r in rows],
+            "case": [r["case_id"] for r in rows],
+            "sample": [r["sample"] for r in rows],
+            "epoch": [r["epoch"] for r in rows]
+        })
+        for i in range(projections.shape[1]):
+            pca_df[f"pc{i + 1}"] = projections[:,i]
+
+        return pca_df, explained
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Small per-layer and per-cell-type weight statistics, written as JSON 
+sidecars next to snapshots so analyses don't need to load full snapshots.
+"""
+import torch
+import numpy as np
+import os
+import json
+
+try:
+    from .SegmentStats import get_group_ids, segment_accumulate
+except:
+    from SegmentStats import get_group_ids, segment_accumulate
+
+try:
+    from .SnapshotIO import load_snapshot
+except:
+    from SnapshotIO import load_snapshot
+
+summary_ext = ".summary.json"
+
+def get_summary_path(net_filepath):
+    """
+    Returns the sidecar path for the snapshot at net_filepath
+    """
+    return os.path.splitext(net_filepath)[0] + summary_ext
+
+def is_weight(key):
+
+    return key.endswith(".weight")
+
+def acc_item(acc, *idx):
+    """
+    Pulls a single segment's accumulators out as floats, summing over
+    any trailing dims not indexed
+    """
+    return { name: vals[idx].sum().item() for name, vals in acc.items() }
+
+def stats_mean(acc):
+    """
+    Mean absolute value from accumulators
+    """
+    return acc["abs_sum"] / acc["count"]
+
+def stats_sem(acc):
+    """
+    Standard error of the mean absolute value from accumulators, matching
+    torch.std(abs(x)) / sqrt(n)
+    """
+    n = acc["count"]
+    if n < 2:
+        return np.nan
+
+    var = (acc["sq_sum"] - acc["abs_sum"] ** 2 / n) / (n - 1)
+    return np.sqrt(max(var, 0.)) / np.sqrt(n)
+
+def summarize_weights(state_dict, modified_layers, initial_state=None):
+    """
+    Summarizes each weight tensor in state_dict, overall and per cell type.
+
+    Args:
+        state_dict (dict)
+        modified_layers (dict): The net's activation modifications, or None
+            for an unmodified (relu) net.
+        initial_state (dict): Epoch 0 weights to summarize deltas from, 
+            e.g. lazily mapped from the epoch 0 snapshot by load_tensors.
+            Deltas are taken one layer at a time.
+
+    Returns:
+        layers (dict): Layer name to its summary.
+    """
+    if modified_layers is not None:
+        act_fns = modified_layers["act_fns"]
+        act_fn_params = modified_layers["act_fn_params"]
+        n_repeat = modified_layers["n_repeat"]
+    else:
+        act_fns, act_fn_params, n_repeat = ["relu"], [None], 1
+
+    keys = [k for k in state_dict.keys() if is_weight(k)]
+    tensors = [state_dict[k].detach().cpu() for k in keys]
+    group_ids = [get_group_ids(len(t), len(act_fns), n_repeat) for t in tensors]
+
+    # every layer and cell type in one reduction
+    acc = segment_accumulate(tensors, group_ids, len(act_fns))
+    delta_acc = None
+    if initial_state is not None and len(keys) > 0:
+        layer_accs = [segment_accumulate(t - initial_state[k].cpu(), ids, 
+            len(act_fns)) for k, t, ids in zip(keys, tensors, group_ids)]
+        delta_acc = { name: torch.stack([a[name] for a in layer_accs]) 
+            for name in layer_accs[0] }
+
+    layers = dict()
+    for i, key in enumerate(keys):
+
+        cell_types = []
+        for g, (act_fn, param) in enumerate(zip(act_fns, act_fn_params)):
+            cell_types.append({
+                "act_fn": act_fn,
+                "act_fn_param": param,
+                "weights": acc_item(acc, i, g),
+                "delta": acc_item(delta_acc, i, g) if delta_acc is not None else None
+            })
+        
+        layers[key] = {
+            "weights": acc_item(acc, i),
+            "delta": acc_item(delta_acc, i) if delta_acc is not None else None,
+            "cell_types": cell_types
+        }
+
+    return layers
+
+def save_weight_summary(net_filepath, metadata, state_dict, initial_state=None):
+    """
+    Writes the summary sidecar for a snapshot
+    """
+    summary = {
+        "metadata": metadata,
+        "layers": summarize_weights(state_dict, metadata.get("modified_layers"), 
+            initial_state)
+    }
+
+    with open(get_summary_path(net_filepath), "w") as json_file:
+        json.dump(summary, json_file)
+
+def load_weight_summary(net_filepath):
+    """
+    Loads the summary sidecar for a snapshot, or None if it has none
+    """
+    summary_path = get_summary_path(net_filepath)
+    if not os.path.exists(summary_path):
+        return None
+
+    with open(summary_path, "r") as json_file:
+        return json.load(json_file)
+
+def backfill_run(snapshot_paths, overwrite=False):
+    """
+    Writes summary sidecars for a run's snapshots, given in epoch order 
+    starting from epoch 0. Returns the number written.
+    """
+    initial_state = load_snapshot(snapshot_paths[0], is_weight)["state_dict"]
+    n_written = 0
+
+    for net_filepath in snapshot_paths:
+
+        if not overwrite and os.path.exists(get_summary_path(net_filepath)):
+            continue
+
+        snapshot = load_snapshot(net_filepath, is_weight)
+        state_dict = snapshot.pop("state_dict")
+        save_weight_summary(net_filepath, snapshot, state_dict, initial_state)
+        n_written += 1
+
+    return n_written
@@ -2,7 +2,10 @@ import torch
 import torchvision
 from torchvision import datasets, models, transforms
 import os
+import re
 import sys
+import numpy as np
+from contextlib import contextmanager
 
 # function for getting an identifier for a given net state
 def get_net_tag(net_name, case_id, sample, epoch):
@@ -19,6 +22,13 @@ def get_net_tag(net_name, case_id, sample, epoch):
         
     return net_tag
 
+def get_epoch_from_filename(filename):
+    
+    epoch = re.search(r"\d+\.(pt|snap)$", filename)
+    epoch = int(epoch.group().split(".")[0]) if epoch else None
+    
+    return epoch
+
 def get_net_dir(data_dir, dataset, net_name, train_scheme, case, sample):
     """
     Builds and ensures the proper net directory exists, then returns
@@ -44,6 +54,25 @@ def get_net_dir(data_dir, dataset, net_name, train_scheme, case, sample):
 
     return ensure_sub_dir(data_dir, net_dir)
 
+def get_feature_cache_dir(data_dir, dataset, net_name, train_scheme, case, 
+    sample):
+    """
+    Builds and ensures the feature cache directory for the given net exists, 
+    then returns its full path. Kept outside of nets/ so cached features are
+    never mistaken for snapshots.
+    """
+
+    cache_dir = "feature_cache/"
+
+    for slug in [dataset, net_name, train_scheme, case]:
+        if slug is not None:
+            cache_dir += f"{slug}/"
+
+    if sample is not None:
+        cache_dir += f"sample-{sample}/"
+
+    return ensure_sub_dir(data_dir, cache_dir)
+
 def ensure_sub_dir(data_dir, sub_dir):
     """
     Ensures existence of sub directory of data_dir and 
@@ -63,25 +92,54 @@ def ensure_sub_dir(data_dir, sub_dir):
         
     return sub_dir
 
+@contextmanager
+def skip_weight_init():
+    """
+    Context manager that turns the torch.nn.init functions into no-ops, so
+    nets built inside it skip random initialization. Parameters are left
+    uninitialized and must be loaded from a state dict afterwards.
+    """
+    init_fns = ["uniform_", "normal_", "constant_", "ones_", "zeros_", 
+        "xavier_uniform_", "xavier_normal_", "kaiming_uniform_", 
+        "kaiming_normal_", "trunc_normal_", "orthogonal_"]
+    originals = { name: getattr(torch.nn.init, name) for name in init_fns 
+        if hasattr(torch.nn.init, name) }
+
+    def skip(tensor, *args, **kwargs):
+        return tensor
+
+    for name in originals:
+        setattr(torch.nn.init, name, skip)
+
+    try:
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(torch.nn.init, name, fn)
+
 # standard normalization applied to all stimuli
 normalize = transforms.Normalize(
     [0.485, 0.456, 0.406], 
     [0.229, 0.224, 0.225])
 
-def load_dataset(data_dir, name, batch_size=4):
+def load_dataset(data_dir, name, batch_size=4, augment=True):
+    """
+    Loads the named dataset. With augment=False the training set uses the
+    deterministic val transforms, e.g. for caching features.
+    """
 
     dataset_dir = os.path.join(data_dir, name)
     n_workers = 4
 
     if name == "cifar10":
-        return load_cifar10(dataset_dir, batch_size, n_workers)
+        return load_cifar10(dataset_dir, batch_size, n_workers, augment)
     elif name == "imagenette2":
-        return load_imagenette(dataset_dir, batch_size, n_workers)
+        return load_imagenette(dataset_dir, batch_size, n_workers, augment)
     else:
         print(f"Unrecognized dataset name {name}")
         sys.exit(-1)
 
-def load_imagenette(dataset_dir, batch_size, n_workers):
+def load_imagenette(dataset_dir, batch_size, n_workers, augment=True):
 
     # standard transforms
     img_xy = 227
@@ -96,6 +154,8 @@ def load_imagenette(dataset_dir, batch_size, n_workers):
         transforms.ToTensor(),
         normalize
     ])
+    if not augment:
+        train_xform = val_xform
 
     # datasets
     train_set = datasets.ImageFolder(os.path.join(dataset_dir, "train"),
@@ -112,7 +172,7 @@ def load_imagenette(dataset_dir, batch_size, n_workers):
     
     return (train_set, val_set, train_loader, val_loader)
 
-def load_cifar10(dataset_dir, batch_size, n_workers):
+def load_cifar10(dataset_dir, batch_size, n_workers, augment=True):
 
     # standard transforms
     train_xform = transforms.Compose([
@@ -125,6 +185,8 @@ def load_cifar10(dataset_dir, batch_size, n_workers):
         transforms.ToTensor(),
         normalize
     ])
+    if not augment:
+        train_xform = val_xform
 
     # datasets
     train_set = torchvision.datasets.CIFAR10(root=dataset_dir, train=True,
@@ -141,3 +203,44 @@ def load_cifar10(dataset_dir, batch_size, n_workers):
         batch_size=batch_size, shuffle=False, num_workers=n_workers)
 
     return (train_set, val_set, train_loader, val_loader)
+
+class FeatureCacheDataset(torch.utils.data.Dataset):
+    """
+    Dataset serving cached feature vectors from a memory-mapped .npy file
+    """
+
+    def __init__(self, features_path, labels_path):
+
+        self.features = np.load(features_path, mmap_mode="r")
+        self.labels = np.load(labels_path)
+
+    def __len__(self):
+
+        return len(self.labels)
+
+    def __getitem__(self, i):
+
+        return (torch.from_numpy(np.array(self.features[i])), 
+            int(self.labels[i]))
+
+def load_feature_cache(cache_dir, batch_size=4):
+    """
+    Loads cached train and val features written by 
+    NetManager.cache_features. Returns the same tuple as load_dataset.
+    """
+
+    train_set = FeatureCacheDataset(
+        os.path.join(cache_dir, "train_features.npy"), 
+        os.path.join(cache_dir, "train_labels.npy"))
+    val_set = FeatureCacheDataset(
+        os.path.join(cache_dir, "val_features.npy"), 
+        os.path.join(cache_dir, "val_labels.npy"))
+
+    # features are already decoded, so no need for worker processes
+    train_loader = torch.utils.data.DataLoader(train_set, 
+        batch_size=batch_size, shuffle=True, num_workers=0)
+
+    val_loader = torch.utils.data.DataLoader(val_set, 
+        batch_size=batch_size, shuffle=False, num_workers=0)
+
+    return (train_set, val_set, train_loader, val_loader)
@@ -0,0 +1,59 @@
+import tempfile
+
+import pytest
+import torch
+import torch.nn as nn
+
+from modules.NetManager import NetManager
+
+
+def build_manager(net_name, mixed):
+    torch.manual_seed(0)
+    manager = NetManager("cifar10", net_name, 10, tempfile.mkdtemp(), 
+        "sgd", seed=0)
+    if mixed:
+        manager.init_net("mixed", 0)
+        manager.replace_act_layers(2, ["relu", "tanh"], ["None", "None"])
+    else:
+        # keeps the nets' own in-place relus
+        manager.init_net("relu", 0)
+    manager.net.train()
+    return manager
+
+
+def run_step(manager, inputs, labels, n_segments):
+    manager.set_checkpointing(n_segments)
+    manager.net.zero_grad()
+
+    # same dropout masks for every configuration
+    torch.manual_seed(1)
+    outputs = manager.run_net(inputs)
+    nn.functional.cross_entropy(outputs, labels).backward()
+
+    grads = [p.grad.clone() for p in manager.net.parameters()]
+    return outputs.detach(), grads
+
+
+@pytest.mark.parametrize("net_name, mixed, n_segments", [
+    ("sticknet8", True, 1),
+    ("sticknet8", True, 2),
+    ("sticknet8", True, 4),
+    ("sticknet8", False, 4),
+    ("sticknet8", False, 5),
+    ("sticknet8", False, 7),
+    ("vgg11_cifar", False, 3),
+    ("vgg11_cifar", False, 5),
+    ("vgg11_cifar", False, 7),
+])
+def test_checkpointing_matches_unsegmented(net_name, mixed, n_segments):
+    manager = build_manager(net_name, mixed)
+
+    inputs = torch.randn(8, 3, 32, 32)
+    labels = torch.randint(10, (8,))
+
+    ref_outputs, ref_grads = run_step(manager, inputs, labels, None)
+    outputs, grads = run_step(manager, inputs, labels, n_segments)
+
+    assert torch.equal(outputs, ref_outputs)
+    for grad, ref_grad in zip(grads, ref_grads):
+        assert torch.equal(grad, ref_grad)
@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+import torch
+
+from modules.ResponseStore import CompressedResponseWriter, \
+    CompressedResponseReader
+
+
+def write_responses(responses, mode="fp32"):
+    filepath = os.path.join(tempfile.mkdtemp(), "responses.rsp")
+    writer = CompressedResponseWriter(filepath, mode=mode, stimulus_chunk=16,
+        channel_chunk=4)
+    writer.write(responses)
+    writer.close()
+    return CompressedResponseReader(filepath)
+
+
+def test_read_clamps_range_past_end():
+    responses = torch.randn(40, 10)
+    reader = write_responses(responses)
+
+    assert torch.equal(reader.read((30, 60)), responses[30:60])
+    assert torch.equal(reader.read((30, 60), (8, 20)), responses[30:60, 8:20])
+    assert reader.read((50, 60)).shape == (0, 10)
@@ -9,7 +9,7 @@ import sys
 import os
 import numpy as np
 import argparse
-from modules.NetManager import NetManager
+from modules.NetManager import NetManager, lr_scaling_rules
 import torch.nn as nn
 import torch.optim as optim
 from torch.optim import lr_scheduler
@@ -28,6 +28,21 @@ parser.add_argument("--lr_gamma", type=float, required=True)
 parser.add_argument("--batch_size", type=int, required=True)
 parser.add_argument("--net_filepath", type=str, help="Set value for net_filepath")
 parser.add_argument("--scheme", type=str, help="Set scheme", required=True)
+parser.add_argument("--cache_features", dest="cache_features", action="store_true",
+                    help="Freeze feature layers and train classifier from cached features")
+parser.add_argument("--write_summaries", dest="write_summaries", action="store_true",
+                    help="Write weight summary sidecars alongside snapshots")
+parser.add_argument("--act_stats_rate", default=0., type=float, 
+                    help="Fraction of training batches to record activation stats for, 0 for none")
+parser.add_argument("--grad_stats", dest="grad_stats", action="store_true",
+                    help="Record per cell type gradient norms every epoch")
+parser.add_argument("--checkpoint_segments", default=None, type=int, 
+                    help="Checkpoint the feature layers in this many segments to save memory")
+parser.add_argument("--memory_budget", default=None, type=float, 
+                    help="Use the largest batch size fitting in this many GB (0 for 90%% of the gpu), scaling lr from batch_size")
+parser.add_argument("--lr_rule", default=None, type=str, 
+                    help="Learning rate scaling rule with --memory_budget: linear, sqrt or none, by default linear for sgd and sqrt for adam")
+parser.set_defaults(cache_features=False, write_summaries=False, grad_stats=False)
 
 
 def create_optimizer(name, manager, lr, momentum):
@@ -52,16 +67,74 @@ def get_training_vars(name, manager, lr, lr_step_size, lr_gamma, momentum):
 
     return (criterion, optimizer, scheduler)
 
+def check_batch_config(batch_config, batch_size, lr, memory_budget, lr_rule):
+    """
+    Raises if the flags a run is resumed with contradict the batch size 
+    choice recorded in its snapshot
+    """
+    conflicts = []
+    if batch_size is not None and batch_size != batch_config["base_batch_size"]:
+        conflicts.append(f"batch_size {batch_size} != {batch_config['base_batch_size']}")
+    if lr is not None and lr != batch_config["base_lr"]:
+        conflicts.append(f"lr {lr} != {batch_config['base_lr']}")
+    if lr_rule is not None and lr_rule != batch_config["lr_rule"]:
+        conflicts.append(f"lr_rule {lr_rule} != {batch_config['lr_rule']}")
+    if (memory_budget is not None and memory_budget > 0 
+        and memory_budget * 2**30 != batch_config["memory_budget"]):
+        conflicts.append(f"memory_budget {memory_budget} GB != " 
+            + f"{batch_config['memory_budget'] / 2**30} GB")
+
+    if len(conflicts) > 0:
+        raise ValueError("Flags contradict the snapshot's recorded batch_config: " 
+            + ", ".join(conflicts))
+
 def main(net_filepath, data_dir, net_name, n_classes, epochs, train_frac,
-         lr, lr_step_size, lr_gamma, batch_size, scheme, dataset, momentum):
+         lr, lr_step_size, lr_gamma, batch_size, scheme, dataset, momentum,
+         cache_features, write_summaries, act_stats_rate=0., grad_stats=False,
+         checkpoint_segments=None, memory_budget=None, lr_rule=None):
     
     # init net manager
     manager = NetManager(dataset, net_name, n_classes, data_dir, scheme)
-    manager.load_dataset(batch_size)
+    manager.write_summaries = write_summaries
+    if not cache_features:
+        manager.load_dataset(batch_size)
     
     # load the proper net
     manager.load_net_snapshot_from_path(net_filepath)
 
+    # optionally train the classifier from cached frozen-backbone features
+    if cache_features:
+        manager.cache_features(batch_size)
+
+    # optionally recompute feature activations during backward
+    manager.set_checkpointing(checkpoint_segments)
+
+    # optionally use the largest batch size that fits, before any stats 
+    # tracking so the probe isn't recorded
+    if manager.batch_config is not None:
+        # a resumed auto-sized run keeps its batch size and learning rate
+        check_batch_config(manager.batch_config, batch_size, lr, 
+            memory_budget, lr_rule)
+        batch_size = manager.batch_config["batch_size"]
+        lr = manager.batch_config["lr"]
+        manager.set_batch_size(batch_size)
+        print(f"Resuming with batch size {batch_size} and learning rate {lr}")
+    elif memory_budget is not None:
+        # Adam's default learning rate if none was given
+        base_lr = lr if lr is not None else 1e-3
+        lr_rule = lr_rule if lr_rule is not None else lr_scaling_rules.get(scheme, "linear")
+        budget = memory_budget * 2**30 if memory_budget > 0 else None
+        (batch_size, lr) = manager.auto_batch_size(batch_size, base_lr, 
+            lr_rule, budget)
+
+    # optionally track per cell type activation stats
+    if act_stats_rate > 0:
+        manager.track_act_stats(act_stats_rate)
+
+    # optionally track per cell type gradient norms
+    if grad_stats:
+        manager.track_grad_stats()
+
     # training scheme vars
     (criterion, optimizer, scheduler) = get_training_vars(scheme, 
         manager, lr, lr_step_size, lr_gamma, momentum)
@@ -74,9 +147,7 @@ def main(net_filepath, data_dir, net_name, n_classes, epochs, train_frac,
                 scheduler.step()
         
         # load perf stats
-        stats_filepath = os.path.join(manager.net_dir, "perf_stats.npy")
-        perf_stats = np.load(stats_filepath, allow_pickle=True).item().get("perf_stats")
-        manager.perf_stats = perf_stats.tolist()
+        manager.load_perf_stats()
 
     # train
     manager.run_training_loop(criterion, optimizer, scheduler, train_frac, 
@@ -13,6 +13,7 @@ from modules.NetManager import nets
 parser = argparse.ArgumentParser()
 parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", type=str, help="Set value for data_dir")
 parser.add_argument("--n_classes", default=10, type=int, help="Set value for n_classes")
+parser.add_argument("--n_workers", default=1, type=int, help="Processes for snapshot analytics")
 
 # required params
 parser.add_argument("--net_name", type=str, help="Set value for net_name")
@@ -20,10 +21,10 @@ parser.add_argument("--schemes", nargs="+", type=str, help="Set schemes")
 parser.add_argument("--cases", nargs="+", type=str, help="Set cases")
 
 
-def main(data_dir, net_name, schemes, cases, n_classes):
+def main(data_dir, net_name, schemes, cases, n_classes, n_workers):
     
     # init visualizer
-    vis = Visualizer(data_dir, n_classes, True)
+    vis = Visualizer(data_dir, n_classes, True, n_workers=n_workers)
     
     # plot
     vis.plot_accuracy(net_name, cases, schemes)
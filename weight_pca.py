@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projects the snapshots of the given runs onto the top principal components
+of their weights, for comparing training trajectories between cases
+"""
+import argparse
+import os
+from modules.NetManager import NetManager, nets
+from modules.WeightPCA import WeightPCA
+from modules.util import ensure_sub_dir
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--data_dir", default="/home/briardoty/Source/allen-inst-cell-types/data/", 
+                    type=str, help="Set value for data_dir")
+parser.add_argument("--dataset", default="imagenette2", type=str, help="Set value for dataset")
+parser.add_argument("--net_name", type=str, help="Set value for net_name")
+parser.add_argument("--schemes", nargs="+", type=str, help="Set schemes")
+parser.add_argument("--cases", nargs="+", type=str, help="Set cases")
+parser.add_argument("--n_components", default=3, type=int, help="Components to project onto")
+parser.add_argument("--sketch_dim", default=4096, type=int, help="Size of each snapshot's weight sketch")
+parser.add_argument("--layers_of_interest", dest="layers_of_interest", action="store_true", 
+                    help="Only use the net's state_keys layers")
+parser.set_defaults(layers_of_interest=False)
+
+
+def main(data_dir, dataset, net_name, schemes, cases, n_components, 
+    sketch_dim, layers_of_interest):
+    
+    manager = NetManager(dataset, net_name, 10, data_dir, None)
+    state_keys = None
+    if layers_of_interest:
+        state_keys = list(nets[net_name]["state_keys"].keys())
+
+    runs = manager.snapshot_index.query_runs(dataset=dataset, net_name=net_name,
+        train_schemes=schemes, cases=cases)
+    pca = WeightPCA(manager, sketch_dim, state_keys)
+    pca_df, explained = pca.transform_runs(runs, n_components)
+
+    print(f"Explained variance ratio: {explained}")
+    sub_dir = ensure_sub_dir(data_dir, "dataframes/")
+    filename = os.path.join(sub_dir, f"{net_name}_weight_pca.csv")
+    pca_df.to_csv(filename, header=True, index=False)
+    print(f"Saved {filename}")
+
+    print("weight_pca.py completed")
+    return
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    print(args)
+    main(**vars(args))